@@ -28,6 +28,7 @@ import numpy as np
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
 # Utils
 from Utils.Grad_cam import make_gradcam_heatmap
+from Utils.Inference_engine import InferenceEngine, list_images
 from Utils.print_color_V1_OLD import print_Color
 from Utils.Other import *  # noqa: F403
 
@@ -42,6 +43,7 @@ Github_repo_Releases_Model_light_name = "PAI_model_light_T.h5"
 Github_repo_Releases_URL = "https://api.github.com/repos/Aydinhamedi/Pneumonia-Detection-Ai/releases/latest"
 Model_FORMAT = "H5_SF"  # TF_dir/H5_SF
 IMG_RES = (224, 224, 3)
+Inference_batch_size = 32
 train_epochs_def = 4
 SHOW_CSAA_OS = False
 # normal global
@@ -49,6 +51,7 @@ img_array = None
 Debug_m = False
 label = None
 model = None
+inference_engine = None
 # Other
 logger.remove()
 logger.add("Data\\logs\\SYS_LOG_{time}.log", backtrace=True, diagnose=True, compression="zip")
@@ -454,7 +457,7 @@ def CI_tmwd(argv_Split: list = ["none"]):
                 if model is None:
                     print_Color("loading the Ai model...", ["normal"])
                     model = load_model(Model_dir)
-            except (ImportError, IOError):
+            except (ImportError, OSError):
                 print_Color(
                     "~*ERROR: ~*Failed to load the model. Try running `uaim` first.",
                     ["red", "yellow"],
@@ -484,6 +487,16 @@ def CI_ulmd():
     print_Color("Warning: upload model data set (currently not available!!!)", ["yellow"])
 
 
+# get_inference_engine
+def get_inference_engine():
+    """Returns the (batched) InferenceEngine of the loaded model, made again if the model was reloaded."""
+    # global var import
+    global inference_engine
+    if inference_engine is None or inference_engine.model is not model:
+        inference_engine = InferenceEngine(model, img_res=IMG_RES, batch_size=Inference_batch_size)
+    return inference_engine
+
+
 # CI_pwai
 def CI_pwai(Auto: bool = False):
     # global var import
@@ -494,7 +507,7 @@ def CI_pwai(Auto: bool = False):
             if model is None:
                 print_Color("loading the Ai model...", ["normal"])
                 model = load_model(Model_dir)
-        except (ImportError, IOError):
+        except (ImportError, OSError):
             print_Color(
                 "~*ERROR: ~*Failed to load the model. Try running `uaim` first.",
                 ["red", "yellow"],
@@ -502,7 +515,7 @@ def CI_pwai(Auto: bool = False):
             )
         else:
             print_Color("predicting with the Ai model...", ["normal"])
-            model_prediction_ORG = model.predict(img_array)
+            model_prediction_ORG = get_inference_engine().predict_arrays(img_array)
             model_prediction = np.argmax(model_prediction_ORG, axis=1)
             pred_class = "PNEUMONIA" if model_prediction == 1 else "NORMAL"
             class_color = "red" if model_prediction == 1 else "green"
@@ -573,6 +586,59 @@ def CI_pwai(Auto: bool = False):
         print_Color("~*ERROR: ~*image data doesnt exist.", ["red", "yellow"], advanced_mode=True)
 
 
+# CI_pwad
+def CI_pwad():
+    # global var import
+    global model
+    print_Color("images dir. Enter 'G' for using GUI: ", ["yellow"], print_END="")
+    img_dir = input().strip('"')
+    if img_dir.lower() == "g":
+        img_dir = filedialog.askdirectory()
+    logger.debug(f"CI_pwad:img_dir {img_dir}")
+    if not img_dir or not os.path.isdir(img_dir):
+        print_Color("~*ERROR: ~*Invalid dir. Please provide a dir of images.", ["red", "yellow"], advanced_mode=True)
+        return
+    img_files = list_images(img_dir, IMG_AF)
+    if not img_files:
+        print_Color("~*ERROR: ~*No image files found in the dir.", ["red", "yellow"], advanced_mode=True)
+        return
+    try:
+        if model is None:
+            print_Color("loading the Ai model...", ["normal"])
+            model = load_model(Model_dir)
+    except (ImportError, OSError):
+        print_Color(
+            "~*ERROR: ~*Failed to load the model. Try running `uaim` first.",
+            ["red", "yellow"],
+            advanced_mode=True,
+        )
+    else:
+        print_Color(f"predicting [{len(img_files)}] images with the Ai model...", ["normal"])
+        # Batched (one compiled predict call per batch, the images are decoded in parallel)
+        progress_bar = tqdm(total=len(img_files), unit="img")
+        results = get_inference_engine().predict(img_files, progress_fn=lambda done, total: progress_bar.update(done - progress_bar.n))
+        progress_bar.close()
+        for result in results:
+            file_name = os.path.basename(result["path"])
+            logger.info(f"CI_pwad:{file_name} {result['class']}|{result['confidence']}|{result['error']}")
+            if result["error"] is not None:
+                print_Color(f"~*{file_name}: ~*ERROR: {result['error']}", ["normal", "red"], advanced_mode=True)
+                continue
+            print_Color(
+                f"~*{file_name}: ~*{result['class']}~* with confidence ~*{result['confidence']:.2f}~*"
+                + (" (the confidence is low)." if result["confidence"] < 0.82 else "."),
+                ["normal", "red" if result["class_id"] == 1 else "green", "normal", "green", "normal"],
+                advanced_mode=True,
+            )
+        pneumonia_count = sum(result["class_id"] == 1 for result in results)
+        normal_count = sum(result["class_id"] == 0 for result in results)
+        print_Color(
+            f"~*PNEUMONIA: ~*{pneumonia_count}~* | NORMAL: ~*{normal_count}~* | failed: ~*{len(results) - pneumonia_count - normal_count}",
+            ["normal", "red", "normal", "green", "normal", "yellow"],
+            advanced_mode=True,
+        )
+
+
 # CI_rlmw
 def CI_rlmw():
     # global var import
@@ -582,7 +648,7 @@ def CI_rlmw():
     print_Color("loading the Ai model...", ["normal"])
     try:
         model = load_model(Model_dir)
-    except (ImportError, IOError):
+    except (ImportError, OSError):
         print_Color(
             "~*ERROR: ~*Failed to load the model. Try running `uaim` first.",
             ["red", "yellow"],
@@ -717,6 +783,7 @@ command_tuple = (
     "tmwd",  # train model with dataset
     "ulmd",  # upload model data set (not available!!!)
     "pwai",  # predict with Ai
+    "pwad",  # predict with Ai (dir)
     "rlmw",  # reload model
     "liid",  # load img input data
     "debug",  # Debug
@@ -743,6 +810,7 @@ cmd_descriptions = {
 cmd_descriptions_other = {
     "liid": "Load image data for input",
     "pwai": "Make predictions using the trained AI model",
+    "pwad": "Make predictions for all the images of a dir (batched)",
     "atmd": "Add data to the model dataset for training",
     "tmwd": f"Train the model with the existing dataset. \x1b[31m(deprecated!)\x1b[0m\n\
    │  └────Optional Args:\n\
@@ -840,6 +908,8 @@ def main():
                 CI_ulmd()
             case "pwai":
                 CI_pwai()
+            case "pwad":
+                CI_pwad()
             case "axid":
                 CI_liid(Auto=True)
                 CI_pwai(Auto=True)
@@ -70,6 +70,7 @@ try:
     os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
     # Utils
     from Utils.Grad_cam import make_gradcam_heatmap
+    from Utils.Inference_engine import InferenceEngine, list_images
     from Utils.print_color_V2_NEW import print_Color_V2  # noqa: F401
     from Utils.print_color_V1_OLD import print_Color
     from Utils.FixedDropout import FixedDropout
@@ -96,12 +97,14 @@ Github_repo_Releases_Model_info_name = "model_info.json"
 Github_repo_Releases_URL = "https://api.github.com/repos/Aydinhamedi/Pneumonia-Detection-Ai/releases/latest"
 Model_FORMAT = "H5_SF"  # TF_dir/H5_SF
 IMG_RES = (224, 224, 3)
+Inference_batch_size = 32
 Debug_m = False
 # normal global
 available_models = []
 img_array = None
 label = None
 model = None
+inference_engine = None
 
 
 # Other
@@ -148,6 +151,7 @@ GUI_layout_Tab_main = [
     [
         sg.Input(key="-INPUT_IMG_dir-", enable_events=True, size=(48, 1)),
         sg.Button("Browse", key="-BUTTON_BROWSE_IMG_dir-"),
+        sg.Button("Browse Dir", key="-BUTTON_BROWSE_IMG_folder-"),
     ],
     [sg.Text("Log:", font=(None, 10, "bold"))],
     [sg.Multiline(key="-OUTPUT_ST-", size=(54, 6), autoscroll=True, disabled=True, write_only=True)],
@@ -444,6 +448,16 @@ def download_file_from_github(url: str, file_name: str, save_as: str, chunk_size
 
 
 # CF>>>
+# get_inference_engine
+def get_inference_engine() -> InferenceEngine:
+    """Returns the (batched) InferenceEngine of the loaded model, made again if the model was reloaded."""
+    # global var import
+    global inference_engine
+    if inference_engine is None or inference_engine.model is not model:
+        inference_engine = InferenceEngine(model, img_res=IMG_RES, batch_size=Inference_batch_size)
+    return inference_engine
+
+
 # Ai_Predict
 def Ai_Predict(show_gradcam: bool = True) -> str:
     """
@@ -463,12 +477,12 @@ def Ai_Predict(show_gradcam: bool = True) -> str:
             if model is None:
                 print_Color("loading the Ai model...", ["normal"])
                 model = load_model(Model_dir, custom_objects={"FixedDropout": FixedDropout})
-        except (ImportError, IOError):
+        except (ImportError, OSError):
             logger.warning(f"Ai_Predict>>ERROR: Failed to load the model. Tr({traceback.format_exc()})")
             return "ERROR: Failed to load the model."
         else:
             print_Color("predicting with the Ai model...", ["normal"])
-            model_prediction_ORG = model.predict(img_array)
+            model_prediction_ORG = get_inference_engine().predict_arrays(img_array)
             model_prediction = np.argmax(model_prediction_ORG, axis=1)
             pred_class = "PNEUMONIA" if model_prediction == 1 else "NORMAL"
             confidence = np.max(model_prediction_ORG)
@@ -520,6 +534,56 @@ def Ai_Predict(show_gradcam: bool = True) -> str:
         )
 
 
+# Ai_Predict_dir
+def Ai_Predict_dir(img_dir) -> tuple:
+    """
+    Ai_Predict_dir predicts pneumonia for all the images of a directory in batches (InferenceEngine).
+
+    The images are decoded in parallel and each batch is predicted with one call.
+    The per image results are written to the GUI log.
+
+    Args:
+        img_dir: The images directory.
+
+    Returns:
+        tuple: A summary of the predictions (the PNEUMONIA/NORMAL/failed counts) and the predicted
+        class of the dir ("PNEUMONIA" if any image is predicted PNEUMONIA, "NORMAL" if none is, None on error).
+    """
+    # global var import
+    global model
+    img_files = list_images(img_dir, IMG_AF)
+    if not img_files:
+        return "ERROR: No image files found in the dir.", None
+    try:
+        if model is None:
+            print_Color("loading the Ai model...", ["normal"])
+            model = load_model(Model_dir, custom_objects={"FixedDropout": FixedDropout})
+    except (ImportError, OSError):
+        logger.warning(f"Ai_Predict_dir>>ERROR: Failed to load the model. Tr({traceback.format_exc()})")
+        return "ERROR: Failed to load the model.", None
+    print_Color(f"predicting [{len(img_files)}] images with the Ai model...", ["normal"])
+    results = get_inference_engine().predict(img_files)
+    for result in results:
+        file_name = os.path.basename(result["path"])
+        logger.info(f"Ai_Predict_dir: {file_name} {result['class']}|{result['confidence']}|{result['error']}")
+        if result["error"] is not None:
+            GUI_Queue["-Main_log-"].put(f"ERROR: {file_name}: {result['error']}")
+        else:
+            low_confidence = " WARNING: the confidence is low." if result["confidence"] < 0.82 else ""
+            GUI_Queue["-Main_log-"].put(f"{file_name}: {result['class']} ({result['confidence']:.2f}){low_confidence}")
+    pneumonia_count = sum(result["class_id"] == 1 for result in results)
+    normal_count = sum(result["class_id"] == 0 for result in results)
+    failed_count = len(results) - pneumonia_count - normal_count
+    pred_class = "PNEUMONIA" if pneumonia_count else ("NORMAL" if normal_count else None)
+    return f"[{len(results)}] images | PNEUMONIA: {pneumonia_count} | NORMAL: {normal_count} | failed: {failed_count}", pred_class
+
+
+# Ai_Predict_dir_thread
+def Ai_Predict_dir_thread(img_dir) -> None:
+    """Runs `Ai_Predict_dir` off the GUI event loop and sends its result as the "-PREDICT_DIR_DONE-" event."""
+    GUI_window.write_event_value("-PREDICT_DIR_DONE-", Ai_Predict_dir(img_dir))
+
+
 # reload_model
 def reload_model() -> None:
     """Loads the AI model on startup.
@@ -533,7 +597,7 @@ def reload_model() -> None:
     GUI_Queue["-Main_log-"].put("loading the Ai model...")
     try:
         model = load_model(Model_dir, custom_objects={"FixedDropout": FixedDropout})
-    except (ImportError, IOError):
+    except (ImportError, OSError):
         GUI_Queue["-Main_log-"].put("ERROR: Failed to load the model.")
         logger.warning(f"reload_model>>ERROR: Failed to load the model. Tr({traceback.format_exc()})")
         return None
@@ -757,6 +821,7 @@ def main() -> None:
     print_Color(GUI_text_logo, ["yellow", "green"], advanced_mode=True)
     # prep var
     IMG_dir = None
+    predict_dir_Thread = None
     Update_model_info_LXT = None
     Update_release_files_LXT = None
     # Create the tabs
@@ -802,14 +867,27 @@ def main() -> None:
             IMG_dir = open_file_GUI()
             GUI_window["-INPUT_IMG_dir-"].update(IMG_dir)
 
+        # Handle event for browsing and selecting a directory of images
+        if event == "-BUTTON_BROWSE_IMG_folder-":
+            IMG_dir = filedialog.askdirectory()
+            GUI_window["-INPUT_IMG_dir-"].update(IMG_dir)
+
         # Handle event for confirming the selected image directory
         if event == "-INPUT_IMG_dir-":
             # Retrieve the image directory from the input field and update the display
             IMG_dir = GUI_window["-INPUT_IMG_dir-"].get()
             GUI_window["-INPUT_IMG_dir-"].update(IMG_dir)
 
+        # Handle event for analyzing all the images of the selected directory (batched, on a thread so the GUI is not frozen)
+        if event == "Analyse" and IMG_dir and os.path.isdir(IMG_dir):
+            if predict_dir_Thread is not None and predict_dir_Thread.is_alive():
+                GUI_Queue["-Main_log-"].put("ERROR: A dir is already being analyzed.")
+            else:
+                GUI_Queue["-Main_log-"].put("Analyzing the dir...")
+                predict_dir_Thread = threading.Thread(target=Ai_Predict_dir_thread, args=(IMG_dir,), daemon=True)
+                predict_dir_Thread.start()
         # Handle event for analyzing the selected image
-        if event == "Analyse":
+        elif event == "Analyse":
             # Call the function to load the image and update the output status
             Log_temp_txt = load_image(IMG_dir, Show_DICOM_INFO=values["-CHECKBOX_SHOW_DICOM_INFO-"])
             GUI_Queue["-Main_log-"].put(Log_temp_txt)
@@ -831,6 +909,19 @@ def main() -> None:
                 )
                 UWL()
 
+        # Handle event for the result of the dir analysis (Ai_Predict_dir_thread)
+        if event == "-PREDICT_DIR_DONE-":
+            Log_temp_txt2, pred_class = values["-PREDICT_DIR_DONE-"]
+            logger.info(f"Ai_Predict_dir: {Log_temp_txt2}")
+            GUI_Queue["-Main_log-"].put("Done Analyzing.")
+            UWL()
+            GUI_window["-OUTPUT_ST_R-"].update(
+                Log_temp_txt2,
+                text_color="green" if pred_class == "NORMAL" else "red",
+                background_color="white",
+            )
+            UWL()
+
         # Handle event for updating the AI model
         if event == "-BUTTON_UPDATE_MODEL-":
             # Start a new thread to download the model without freezing the GUI
@@ -0,0 +1,143 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+
+# pydicom is optional (only for DICOM files)
+try:
+    import pydicom
+    from pydicom.errors import InvalidDicomError
+except ImportError:
+    pydicom = None
+    InvalidDicomError = OSError
+
+CLASS_NAMES = ("NORMAL", "PNEUMONIA")
+IMG_EXTENSIONS = ("JPEG", "PNG", "BMP", "TIFF", "JPG", "DCM", "DICOM")
+# The errors of a file that can not be loaded (reported per file), PIL raises OSError (UnidentifiedImageError)
+# for unreadable images and ValueError/RuntimeError for unsupported modes/pixel data
+LOAD_ERRORS = (OSError, ValueError, RuntimeError, ImportError, InvalidDicomError)
+
+
+def list_images(paths, extensions=IMG_EXTENSIONS) -> list:
+    """Returns the image files of a path, a directory or a list of them.
+
+    Directories are not searched recursively, their files are sorted by name.
+
+    Args:
+        paths: A file/directory path or a list of them.
+        extensions: The allowed file extensions (upper case, without the dot).
+
+    Returns:
+        list: The image file paths.
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path)))
+        else:
+            files.append(path)
+    return [file for file in files if os.path.splitext(file)[1].upper()[1:] in extensions]
+
+
+def load_image_array(path, img_res=(224, 224, 3)) -> np.ndarray:
+    """Loads an image file (DICOM too if pydicom is installed) as a float32 (0-1) RGB array of `img_res`."""
+    if os.path.splitext(path)[1].upper()[1:] in ("DCM", "DICOM"):
+        if pydicom is None:
+            raise ImportError("pydicom is required to load DICOM files.")
+        img = Image.fromarray(pydicom.dcmread(path).pixel_array).resize((img_res[1], img_res[0]))
+    else:
+        img = Image.open(path).resize((img_res[1], img_res[0]))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return np.asarray(img, dtype=np.float32) / 255.0
+
+
+class InferenceEngine:
+    """Batched multi image inference.
+
+    The images are decoded in parallel (a thread pool, the next batch is
+    decoded while the current one is predicted), grouped into batches and
+    each batch is predicted with one call of a compiled `tf.function`
+    (traced once for any batch size), instead of one `model.predict` call
+    per image.
+
+    Args:
+        model: The keras model.
+        img_res (tuple): The model input resolution (height, width, channels).
+        batch_size (int): The prediction batch size.
+        workers (int): The number of decoding threads (None for the ThreadPoolExecutor default).
+        class_names (tuple): The class names by class index.
+    """
+
+    def __init__(self, model, img_res=(224, 224, 3), batch_size=32, workers=None, class_names=CLASS_NAMES):
+        self.model = model
+        self.img_res = tuple(img_res)
+        self.batch_size = batch_size
+        self.workers = workers
+        self.class_names = class_names
+        self._predict_step = tf.function(
+            lambda x: model(x, training=False),
+            input_signature=[tf.TensorSpec((None,) + self.img_res, tf.float32)],
+        )
+
+    def predict_arrays(self, images) -> np.ndarray:
+        """Predicts a batch array of images (N, H, W, C) in 0-1.
+
+        Returns:
+            np.ndarray: The class probabilities (N, classes).
+        """
+        images = np.asarray(images, dtype=np.float32)
+        return np.concatenate([
+            self._predict_step(images[start : start + self.batch_size]).numpy() for start in range(0, len(images), self.batch_size)
+        ])
+
+    def _result(self, path, probs=None, error=None) -> dict:
+        if probs is None:
+            return {"path": path, "class": None, "class_id": None, "confidence": None, "probs": None, "error": error}
+        class_id = int(np.argmax(probs))
+        return {
+            "path": path,
+            "class": self.class_names[class_id],
+            "class_id": class_id,
+            "confidence": float(probs[class_id]),
+            "probs": probs,
+            "error": None,
+        }
+
+    def predict(self, paths, progress_fn=None) -> list:
+        """Predicts image files.
+
+        Args:
+            paths: A file/directory path or a list of them (see `list_images`).
+            progress_fn (callable): Optional, called with (done, total) after each batch.
+
+        Returns:
+            list: A dict per file with "path", "class", "class_id", "confidence",
+            "probs" and "error" (the error message if the file failed to load, the
+            other values are None then).
+        """
+        files = list_images(paths)
+        batches = [files[start : start + self.batch_size] for start in range(0, len(files), self.batch_size)]
+        results = []
+        with ThreadPoolExecutor(self.workers) as pool:
+            futures = [pool.submit(load_image_array, file, self.img_res) for file in batches[0]] if batches else []
+            for index, batch in enumerate(batches):
+                images, loaded, failed = [], [], {}
+                for file, future in zip(batch, futures):
+                    try:
+                        images.append(future.result())
+                        loaded.append(file)
+                    except LOAD_ERRORS as err:
+                        failed[file] = str(err)
+                # Decode the next batch while this one is predicted
+                if index + 1 < len(batches):
+                    futures = [pool.submit(load_image_array, file, self.img_res) for file in batches[index + 1]]
+                probs = dict(zip(loaded, self.predict_arrays(np.stack(images)))) if images else {}
+                results.extend(self._result(file, probs.get(file), failed.get(file)) for file in batch)
+                if progress_fn is not None:
+                    progress_fn(len(results), len(files))
+        return results
@@ -0,0 +1,166 @@
+import os
+import queue
+import shutil
+import threading
+
+import tensorflow as tf
+
+# The errors of a failed save (reported by the next call), any other error stops the writer thread
+SAVE_ERRORS = (OSError, ValueError, TypeError, KeyError, RuntimeError, tf.errors.OpError)
+
+
+def _temp_path(path):
+    # Keeps the extension (keras picks the save format from it)
+    root, ext = os.path.splitext(path)
+    return f"{root}.tmp{ext}"
+
+
+def _replace(temp_path, path):
+    if os.path.isdir(temp_path):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+    os.replace(temp_path, path)
+
+
+def _tensor_values(config):
+    # A callable hyperparameter (e.g. the OneCycleSchedule momentum) is serialized as its current tensor value
+    if isinstance(config, dict):
+        if config.get("class_name") == "__tensor__":
+            return config["config"]["value"]
+        return {key: _tensor_values(value) for key, value in config.items()}
+    return config
+
+
+class AsyncCheckpointWriter:
+    """Saves model checkpoints on a background thread.
+
+    `save_weights` and `save_model` only copy the weights to host memory
+    (`model.get_weights()`) and return, so the training continues while a
+    CPU copy of the model (cloned once) is set to the snapshot and written.
+    Each file is written to a temp path first and then renamed over the
+    old one, so a crash never leaves a half written checkpoint. At most
+    `max_pending` snapshots wait in the queue (a save blocks if it is full).
+
+    With `include_optimizer` (like `model.save`) the optimizer weights are
+    snapshotted too and the full models are saved with a copy of the
+    optimizer (made from its current config) set to them.
+
+    A failed save (`SAVE_ERRORS`) is raised by the next call, any other
+    error stops the thread and the next calls raise a `RuntimeError`.
+
+    Args:
+        model (keras.Model): The model to save.
+        max_pending (int): The max number of queued snapshots.
+        include_optimizer (bool): Save the full models with the optimizer state.
+    """
+
+    def __init__(self, model, max_pending=2, include_optimizer=True):
+        self.model = model
+        self.include_optimizer = include_optimizer
+        self._closed = False
+        with tf.device("/CPU:0"):
+            self._shadow = tf.keras.models.clone_model(model)
+        self._queue = queue.Queue(max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="AsyncCheckpointWriter", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                entry = self._queue.get()
+                try:
+                    if entry is None:
+                        return
+                    kind, path, weights, optimizer_snapshot, save_format = entry
+                    temp_path = _temp_path(path)
+                    if optimizer_snapshot is not None:
+                        self._set_shadow_optimizer(*optimizer_snapshot)
+                    self._shadow.set_weights(weights)
+                    if kind == "weights":
+                        self._shadow.save_weights(temp_path)
+                    else:
+                        self._shadow.save(temp_path, save_format=save_format, include_optimizer=optimizer_snapshot is not None)
+                    _replace(temp_path, path)
+                except SAVE_ERRORS as err:
+                    self._error = err
+                finally:
+                    self._queue.task_done()
+        finally:
+            # An unexpected error stopped the thread (`_raise_error` reports it), drop the queue so `flush` does not wait for it
+            if not self._closed:
+                while not self._queue.empty():
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+
+    def _snapshot_optimizer(self):
+        optimizer = self.model.optimizer
+        lr = optimizer.learning_rate
+        # A custom lr schedule (e.g. OneCycleSchedule) has to be known to deserialize the config
+        custom_objects = {type(lr).__name__: type(lr)} if isinstance(lr, tf.keras.optimizers.schedules.LearningRateSchedule) else None
+        return _tensor_values(tf.keras.optimizers.serialize(optimizer)), custom_objects, optimizer.get_weights()
+
+    def _set_shadow_optimizer(self, config, custom_objects, optimizer_weights):
+        with tf.device("/CPU:0"):
+            optimizer = tf.keras.optimizers.deserialize(config, custom_objects=custom_objects)
+            # The training config (loss, metrics...) saved with the model, there is no public getter for the compile args
+            self._shadow.compile(**{**self.model._get_compile_args(), "optimizer": optimizer})
+            # Create the weights of the snapshot so it can be set: a trained optimizer has its slots
+            # (created by applying zero gradients, the shadow weights are set afterwards), a new one at most its iterations
+            if len(optimizer_weights) > 1:
+                inner_optimizer = getattr(optimizer, "inner_optimizer", optimizer)  # No loss scaling (LossScaleOptimizer) needed
+                inner_optimizer.apply_gradients([(tf.zeros_like(variable), variable) for variable in self._shadow.trainable_variables])
+            elif optimizer_weights:
+                _ = optimizer.iterations  # Creates the iterations variable
+            optimizer.set_weights(optimizer_weights)
+
+    def _put(self, kind, path, save_format=None):
+        self._raise_error()
+        optimizer_snapshot = self._snapshot_optimizer() if kind == "model" and self.include_optimizer and self.model.optimizer else None
+        self._queue.put((kind, path, self.model.get_weights(), optimizer_snapshot, save_format))
+
+    def _raise_error(self):
+        if self._error is not None:
+            err, self._error = self._error, None
+            raise err
+        if not self._closed and not self._thread.is_alive():
+            raise RuntimeError("The checkpoint writer thread stopped (see its traceback).")
+
+    def save_weights(self, path):
+        """Queues a `model.save_weights(path)`.
+
+        Raises:
+            Exception: The error of a previous failed save (if any).
+        """
+        self._put("weights", path)
+
+    def save_model(self, path, save_format=None):
+        """Queues a `model.save(path, save_format=save_format)` (with the optimizer state if `include_optimizer`).
+
+        Raises:
+            Exception: The error of a previous failed save (if any).
+        """
+        self._put("model", path, save_format)
+
+    def flush(self):
+        """Waits until all the queued checkpoints are written.
+
+        Raises:
+            Exception: The error of a failed save (if any).
+        """
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        """Writes the queued checkpoints and stops the background thread.
+
+        Raises:
+            Exception: The error of a failed save (if any).
+        """
+        if self._thread.is_alive():
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+        self._raise_error()
@@ -0,0 +1,80 @@
+import os
+
+import numpy as np
+from tensorflow.keras.callbacks import Callback
+
+
+class BestWeightsKeeper(Callback):
+    """Keeps the best weights in memory (instead of a `ModelCheckpoint` file per improvement).
+
+    On each improvement of `monitor` the weights are copied to host memory
+    (`model.get_weights()`), `restore` sets them back with `set_weights`
+    (no disk I/O) and `save` writes them to a single .npz file.
+
+    Args:
+        monitor (str): The monitored metric.
+        mode (str): 'auto', 'min' or 'max' (same as `ModelCheckpoint`).
+        baseline (float): Only values better than this count as an improvement (None for any value).
+    """
+
+    def __init__(self, monitor="val_accuracy", mode="auto", baseline=None):
+        super().__init__()
+        self.monitor = monitor
+        if mode == "auto":
+            mode = "max" if "acc" in monitor or monitor.startswith("fmeasure") else "min"
+        if mode not in ("min", "max"):
+            raise ValueError(f"Unknown mode [{mode}] (expected 'auto', 'min' or 'max').")
+        self.mode = mode
+        self.best_weights = None
+        self.reset(baseline)
+
+    def reset(self, baseline=None):
+        """Starts over from `baseline` (e.g. for a new subset).
+
+        The last best weights are kept for `save`, but `restore` only uses
+        weights from after the reset.
+        """
+        if baseline is None:
+            baseline = float("inf") if self.mode == "min" else -float("inf")
+        self.best = baseline
+        self.best_epoch = None
+
+    def _improved(self, current):
+        return current < self.best if self.mode == "min" else current > self.best
+
+    def on_epoch_end(self, epoch, logs=None):
+        current = (logs or {}).get(self.monitor)
+        if current is not None and self._improved(current):
+            self.best = current
+            self.best_weights = self.model.get_weights()
+            self.best_epoch = epoch
+
+    def restore(self):
+        """Sets the model to the best weights.
+
+        Returns:
+            False if there are no best weights (no improvement since `reset`).
+        """
+        if self.best_epoch is None:
+            return False
+        self.model.set_weights(self.best_weights)
+        return True
+
+    def save(self, path):
+        """Saves the best weights to one .npz file (written to a temp file first).
+
+        Returns:
+            False if there are no best weights.
+        """
+        if self.best_weights is None:
+            return False
+        temp_path = f"{os.path.splitext(path)[0]}.tmp.npz"
+        np.savez(temp_path, *self.best_weights)
+        os.replace(temp_path, path)
+        return True
+
+    @staticmethod
+    def load(model, path):
+        """Sets a model to the weights saved with `save`."""
+        with np.load(path) as data:
+            model.set_weights([data[f"arr_{i}"] for i in range(len(data.files))])
@@ -0,0 +1,85 @@
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import mixed_precision
+
+
+def mixed_precision_enabled():
+    """Returns True if the global keras policy computes in float16 (`mixed_float16`)."""
+    return mixed_precision.global_policy().compute_dtype == "float16"
+
+
+def wrap_optimizer(optimizer):
+    """Wraps an optimizer in a (dynamic) `LossScaleOptimizer` if mixed precision is enabled.
+
+    The lr/momentum of the wrapped optimizer can still be set through the
+    wrapper (e.g. by the `OneCycleLr` callback or `set_optimizer_attribute`),
+    they are delegated to the inner optimizer.
+    """
+    if mixed_precision_enabled() and not isinstance(optimizer, mixed_precision.LossScaleOptimizer):
+        return mixed_precision.LossScaleOptimizer(optimizer)
+    return optimizer
+
+
+def unwrap_optimizer(optimizer):
+    """Returns the inner optimizer of a `LossScaleOptimizer` (or the optimizer itself)."""
+    return getattr(optimizer, "inner_optimizer", optimizer)
+
+
+def compile_model(model, optimizer, jit_compile=False, **compile_kwargs):
+    """Compiles a model for the fast mode.
+
+    The optimizer is wrapped with `wrap_optimizer` (loss scaling under
+    mixed precision) and the train/predict functions are XLA compiled if
+    `jit_compile`. The output head should be built with `dtype="float32"`
+    so the softmax (and the loss) are computed in float32.
+
+    Args:
+        model (keras.Model): The model.
+        optimizer: The optimizer.
+        jit_compile (bool): XLA compile the model functions.
+        **compile_kwargs: The other `model.compile` args (loss, metrics...).
+
+    Returns:
+        The compiled model.
+    """
+    model.compile(optimizer=wrap_optimizer(optimizer), jit_compile=jit_compile, **compile_kwargs)
+    return model
+
+
+def check_numerics(build_fn, x, atol=5e-3, jit_compile=False):
+    """Checks that a model built under `mixed_float16` matches the float32 one.
+
+    Builds the model with `build_fn` under the float32 and the
+    mixed_float16 policies, copies the float32 weights to the mixed model
+    and compares the predictions of `x` (runs on CPU too). The global
+    policy is restored afterwards.
+
+    Args:
+        build_fn (callable): Builds (and compiles) the model under the current global policy.
+        x (np.ndarray): A small batch of model inputs.
+        atol (float): The max allowed absolute difference of the predictions.
+        jit_compile (bool): Predict the mixed model with an XLA compiled function.
+
+    Returns:
+        A dict with the max/mean absolute differences, the output dtype of
+        the mixed model and "passed" (max difference <= atol).
+    """
+    policy = mixed_precision.global_policy()
+    try:
+        mixed_precision.set_global_policy("float32")
+        model_float32 = build_fn()
+        y_float32 = model_float32.predict(x, verbose=0)
+        mixed_precision.set_global_policy("mixed_float16")
+        model_mixed = build_fn()
+        model_mixed.set_weights(model_float32.get_weights())
+        predict_fn = tf.function(lambda batch: model_mixed(batch, training=False), jit_compile=jit_compile)
+        y_mixed = predict_fn(tf.constant(x, tf.float32)).numpy()
+    finally:
+        mixed_precision.set_global_policy(policy)
+    diff = np.abs(y_float32.astype(np.float64) - y_mixed.astype(np.float64))
+    return {
+        "max_abs_diff": float(diff.max()),
+        "mean_abs_diff": float(diff.mean()),
+        "output_dtype": model_mixed.output.dtype.name,
+        "passed": bool(diff.max() <= atol),
+    }
@@ -0,0 +1,21 @@
+from keras.layers import Concatenate, Input
+
+
+def gray_to_rgb_input(img_res, name="Gray_input"):
+    """Makes a single channel model input that is expanded to 3 channels.
+
+    Pass the result as the `input_tensor` of a base model built with a
+    3 channel `input_shape` (e.g. EfficientNet). The model input is then the
+    single channel `Input` while the pretrained weights still load (the
+    expand layer has no weights), so the image data only has to be stored
+    and augmented with one channel.
+
+    Args:
+        img_res (list): The [height, width, channels] the base model expects.
+        name (str): The name of the input layer.
+
+    Returns:
+        The expanded (height, width, 3) keras tensor.
+    """
+    inputs = Input(shape=(img_res[0], img_res[1], 1), name=name)
+    return Concatenate(axis=-1, name=f"{name}_to_RGB")([inputs] * img_res[2])
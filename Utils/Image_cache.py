@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from Utils.print_color_V1_OLD import print_Color
+from Utils.Shard_loader import ShardedArray, decode_image, list_class_files
+
+
+def file_hash(data):
+    """Returns the sha1 hex digest of a uint8 byte array."""
+    return hashlib.sha1(data.tobytes()).hexdigest()
+
+
+class ImageCache:
+    """Persistent uint8 memory-mapped cache of decoded and resized images.
+
+    Each split is stored as a raw `<split>.bin` file (one image after the
+    other) plus a `<split>_index.json` with the path, mtime, size, sha1 hash
+    and label of every cached image. The cache lives in a sub folder named
+    after `img_res`, so changing the resolution never reuses stale images.
+
+    On `sync` only new files are decoded and appended. Files whose mtime or
+    size changed are re-hashed and, if the content changed, re-decoded in
+    place. If files were removed or the classes changed the split is
+    rebuilt.
+
+    Args:
+        cache_dir (str): The root cache directory.
+        img_res (list): The [height, width, channels] of the images.
+    """
+
+    def __init__(self, cache_dir, img_res):
+        self.img_res = list(img_res)
+        self.cache_dir = os.path.join(cache_dir, "x".join(str(v) for v in self.img_res))
+        self.color_mode = "grayscale" if self.img_res[2] == 1 else "rgb"
+        self.img_size = int(np.prod(self.img_res))
+
+    def _paths(self, split):
+        return os.path.join(self.cache_dir, f"{split}.bin"), os.path.join(self.cache_dir, f"{split}_index.json")
+
+    def _load_index(self, split, classes):
+        bin_path, index_path = self._paths(split)
+        if not (os.path.exists(index_path) and os.path.exists(bin_path)):
+            return []
+        with open(index_path) as f:
+            index = json.load(f)
+        if index["img_res"] != self.img_res or index["classes"] != classes:
+            return []
+        # Drop entries that were never flushed to the .bin file (interrupted sync)
+        return index["entries"][: os.path.getsize(bin_path) // self.img_size]
+
+    def _save_index(self, split, classes, entries):
+        _, index_path = self._paths(split)
+        with open(index_path + ".tmp", "w") as f:
+            json.dump({"img_res": self.img_res, "classes": classes, "entries": entries}, f)
+        os.replace(index_path + ".tmp", index_path)
+
+    def _read(self, path):
+        data = np.fromfile(path, dtype=np.uint8)
+        stat = os.stat(path)
+        return data, stat.st_mtime, stat.st_size
+
+    def sync(self, split, directory, scale=None):
+        """Updates the cache of a split and returns it memory-mapped.
+
+        Args:
+            split (str): The split name (e.g. 'train', 'test' or 'val').
+            directory (str): The split directory (one sub folder per class).
+            scale (float): If not None the images are returned as float32
+                multiplied by `scale` when indexed. If None they stay uint8.
+
+        Returns:
+            A tuple (x, y) where x is a lazy `ShardedArray` over the cached
+            images and y is the int64 label array.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        bin_path, _ = self._paths(split)
+        files, labels, classes = list_class_files(directory)
+        entries = self._load_index(split, classes)
+        current = dict(zip(files, labels))
+        if any(entry["path"] not in current for entry in entries):
+            print_Color(f"[{split}] Files were removed, rebuilding the cache...", ["yellow"])
+            entries = []
+        if not entries and os.path.exists(bin_path):
+            os.remove(bin_path)
+        # Check the cached files
+        changed = 0
+        cached = {entry["path"]: i for i, entry in enumerate(entries)}
+        if entries:
+            cache = np.memmap(bin_path, dtype=np.uint8, mode="r+", shape=(len(entries), *self.img_res))
+            for i, entry in enumerate(entries):
+                stat = os.stat(entry["path"])
+                if stat.st_mtime == entry["mtime"] and stat.st_size == entry["size"]:
+                    continue
+                data, entry["mtime"], entry["size"] = self._read(entry["path"])
+                digest = file_hash(data)
+                if digest != entry["hash"]:
+                    cache[i] = decode_image(data, self.img_res[:2], self.color_mode, entry["path"])
+                    entry["hash"] = digest
+                    changed += 1
+            cache.flush()
+            del cache
+        # Append the new files
+        new_files = [path for path in files if path not in cached]
+        with open(bin_path, "ab") as f:
+            # Drop the images an interrupted sync appended past the end of the index
+            f.truncate(len(entries) * self.img_size)
+            for i, path in enumerate(new_files):
+                print(f">   [{split}] Caching new images [{i + 1}/{len(new_files)}]...", end="\r")
+                data, mtime, size = self._read(path)
+                f.write(decode_image(data, self.img_res[:2], self.color_mode, path).tobytes())
+                entries.append({"path": path, "mtime": mtime, "size": size, "hash": file_hash(data), "label": current[path]})
+        if new_files:
+            print()
+        self._save_index(split, classes, entries)
+        print_Color(
+            f"~*[{split}] Image cache: ~*{len(entries)}~* images (~*{len(new_files)}~* new, ~*{changed}~* changed)",
+            ["normal", "green", "normal", "green", "normal", "green", "normal"],
+            advanced_mode=True,
+        )
+        x = np.memmap(bin_path, dtype=np.uint8, mode="r", shape=(len(entries), *self.img_res)) if entries else None
+        y = np.asarray([entry["label"] for entry in entries], dtype=np.int64)
+        return ShardedArray([x], max(len(entries), 1), len(entries), self.img_res, scale=scale), y
@@ -0,0 +1,267 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# Block-intensity noise profiles:
+#  intensity_L3: (L2, L1) max intensity for the 'L3' (L2 + L1) noise type.
+#  intensity: (L2, L1) max intensity for the 'L1' and 'L2' noise types.
+#  block_L1/block_L2: (min, max) block size (inclusive).
+#  per_channel: Use a different block multiplier for each channel.
+#  grain: Max grain intensity.
+#  grain_type: 'uniform' (0 to 255) or 'triangular' (-255 to 255) grain.
+NOISE_PROFILES = {
+    # noise_func (data processing)
+    "V1": {
+        "intensity_L3": (0.05, 0.04),
+        "intensity": (0.06, 0.04),
+        "block_L1": (16, 32),
+        "block_L2": (32, 64),
+        "per_channel": False,
+        "grain": 0.045,
+        "grain_type": "uniform",
+    },
+    # noise_func_TRLRev2 ([REV1 OLD])
+    "TRLRev2": {
+        "intensity_L3": (0.08, 0.05),
+        "intensity": (0.09, 0.06),
+        "block_L1": (16, 32),
+        "block_L2": (32, 112),
+        "per_channel": False,
+        "grain": 0.07,
+        "grain_type": "triangular",
+    },
+    # noise_func_TRLRev2 ([REV2 NEW])
+    "TRLRev2_PC": {
+        "intensity_L3": (0.07, 0.06),
+        "intensity": (0.09, 0.07),
+        "block_L1": (16, 32),
+        "block_L2": (32, 112),
+        "per_channel": True,
+        "grain": 0.05,
+        "grain_type": "triangular",
+    },
+}
+# Noise types
+_NT_L1, _NT_L2, _NT_L3 = 0, 1, 2  # 3 = none
+
+_default_rng = np.random.default_rng()
+
+
+def _apply_blocks(src, dst, grid, block_size):
+    """Multiplies each (block_size x block_size) block of `src` by its `grid` value into `dst`.
+
+    The image is viewed as (rows, block, cols, block * C) blocks so the grid
+    is applied with one broadcast multiply. The partial blocks on the bottom
+    and right edges (if the size is not a multiple of block_size) are separate
+    views. `src` and `dst` must be C-contiguous (H, W, C) arrays.
+    """
+    h, w, c = src.shape
+    nh, nw = h // block_size, w // block_size
+    hb, wbc = nh * block_size, nw * block_size * c
+    # (H, W, C) -> (H, W * C), a block row is then block_size * C contiguous values
+    src, dst = src.reshape(h, w * c), dst.reshape(h, w * c)
+    if grid.shape[-1] > 1:
+        # Per channel grid, repeat the channel pattern over the block width
+        grid = np.tile(grid, (1, 1, block_size))
+    bc = block_size * c
+    np.multiply(
+        src[:hb, :wbc].reshape(nh, block_size, nw, bc),
+        grid[:nh, None, :nw],
+        out=dst[:hb, :wbc].reshape(nh, block_size, nw, bc),
+    )
+    if hb < h:
+        np.multiply(src[hb:, :wbc].reshape(h - hb, nw, bc), grid[nh, :nw], out=dst[hb:, :wbc].reshape(h - hb, nw, bc))
+    if wbc < w * c:
+        edge = w * c - wbc
+        edge_grid = grid[:, :, :edge] if grid.shape[-1] > 1 else grid
+        np.multiply(
+            src[:hb, wbc:].reshape(nh, block_size, edge), edge_grid[:nh, None, nw], out=dst[:hb, wbc:].reshape(nh, block_size, edge)
+        )
+        if hb < h:
+            np.multiply(src[hb:, wbc:], edge_grid[nh, nw], out=dst[hb:, wbc:])
+
+
+def _noise_chunk(images, out, profile, grain, rng):
+    n, h, w, c = images.shape
+    noise_type = rng.integers(0, 4, n)
+    is_L3 = noise_type == _NT_L3
+    levels = (
+        # L2 is applied first and L1 on top of it (like the original loops)
+        (
+            (noise_type == _NT_L2) | is_L3,
+            rng.uniform(-1, 1, n) * np.where(is_L3, profile["intensity_L3"][0], profile["intensity"][0]),
+            rng.integers(profile["block_L2"][0], profile["block_L2"][1] + 1, n),
+        ),
+        (
+            (noise_type == _NT_L1) | is_L3,
+            rng.uniform(-1, 1, n) * np.where(is_L3, profile["intensity_L3"][1], profile["intensity"][1]),
+            rng.integers(profile["block_L1"][0], profile["block_L1"][1] + 1, n),
+        ),
+    )
+    channels = c if profile["per_channel"] else 1
+    # Work directly in `out` unless it is an integer array
+    result = out if np.issubdtype(out.dtype, np.floating) else np.empty(images.shape, dtype=np.float32)
+    written = np.zeros(n, dtype=bool)
+    for active, intensity, block_size in levels:
+        for i in np.flatnonzero(active):
+            grid_shape = (-(-h // block_size[i]), -(-w // block_size[i]), channels)
+            grid = rng.random(grid_shape, dtype=np.float32) * np.float32(intensity[i]) + 1
+            _apply_blocks(result[i] if written[i] else images[i], result[i], grid, block_size[i])
+            written[i] = True
+    for i in np.flatnonzero(~written):
+        result[i] = images[i]
+    if grain:
+        grain_intensity = rng.uniform(0, profile["grain"], n).astype(np.float32)[:, None, None, None]
+        # Random bytes are much faster to draw than bounded integers
+        if profile["grain_type"] == "uniform":
+            grain_noise = np.frombuffer(rng.bytes(images.size), dtype=np.uint8).reshape(images.shape)
+            grain_noise = np.multiply(grain_noise, grain_intensity, dtype=np.float32)
+        else:
+            # The difference of two uniform bytes has the same triangular
+            # (-255 to 255) distribution as the mean of two uniform (-255, 255) ints
+            grain_noise = np.frombuffer(rng.bytes(images.size * 2), dtype=np.uint8).reshape((2,) + images.shape)
+            grain_noise = np.subtract(grain_noise[0], grain_noise[1], dtype=np.float32)
+            grain_noise *= grain_intensity
+        result += grain_noise
+    if result is not out:
+        np.clip(np.rint(result, out=result), 0, 255, out=result)
+        out[...] = result
+
+
+def block_noise_batch(images, profile="TRLRev2", grain=True, rng=None, out=None, chunk_size=256):
+    """Applies block-intensity noise (and grain) to a batch of images.
+
+    Vectorized replacement of the nested block loops of `noise_func` /
+    `noise_func_TRLRev2`. For each image a random noise type ('L1', 'L2',
+    'L3' or none) is chosen and all the random values of the batch are drawn
+    at once. Each noise level is then applied with one broadcast multiply of
+    the image (viewed as blocks) by its block grid, with no per block loop.
+
+    Args:
+        images (np.ndarray): The (N, H, W, C) images in the 0-255 range.
+        profile (str): The noise profile name (see `NOISE_PROFILES`).
+        grain (bool): Add random grain noise.
+        rng (np.random.Generator): Optional random generator.
+        out (np.ndarray): Optional C-contiguous output array (can be `images` itself).
+        chunk_size (int): The number of images processed at once (bounds the
+            size of the float32 and grain temporaries).
+
+    Returns:
+        The noisy images (float32 if `images` is uint8 and `out` is None).
+    """
+    profile = NOISE_PROFILES[profile]
+    rng = _default_rng if rng is None else rng
+    images = np.ascontiguousarray(images)
+    if out is None:
+        out = np.empty(images.shape, dtype=np.float32 if np.issubdtype(images.dtype, np.integer) else images.dtype)
+    for i in range(0, len(images), chunk_size):
+        _noise_chunk(images[i : i + chunk_size], out[i : i + chunk_size], profile, grain, rng)
+    return out
+
+
+def block_noise(image, profile="TRLRev2", grain=True, rng=None):
+    """Applies block-intensity noise (and grain) to one (H, W, C) image.
+
+    Can be used as an `ImageDataGenerator` `preprocessing_function`
+    (see `block_noise_batch`).
+    """
+    return block_noise_batch(image[np.newaxis], profile, grain, rng)[0]
+
+
+def _clahe_range(images, out, start, end, clip_limit, tile_grid_size, luminance, alpha, beta):
+    # CLAHE objects are not thread safe, each worker makes its own
+    clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid_size)
+    direct = out.dtype == np.uint8
+    for i in range(start, end):
+        if images.dtype == np.uint8 and alpha == 1 and beta == 0:
+            image = images[i]
+        else:
+            image = cv2.convertScaleAbs(images[i], alpha=alpha, beta=beta)
+        if image.shape[-1] == 1:
+            equalized = clahe.apply(image[..., 0])[..., np.newaxis]
+        elif luminance:
+            ycrcb = cv2.cvtColor(image, cv2.COLOR_RGB2YCrCb)
+            ycrcb[..., 0] = clahe.apply(np.ascontiguousarray(ycrcb[..., 0]))
+            equalized = cv2.cvtColor(ycrcb, cv2.COLOR_YCrCb2RGB)
+        else:
+            channels = [clahe.apply(channel) for channel in cv2.split(image)]
+            if direct:
+                cv2.merge(channels, dst=out[i])
+                continue
+            equalized = cv2.merge(channels)
+        out[i] = equalized
+
+
+def clahe_batch(images, clip_limit=1.8, tile_grid_size=(8, 8), out=None, workers=None, luminance=False, alpha=1, beta=0):
+    """Applies CLAHE (adaptive histogram equalization) to a batch of images on multiple cores.
+
+    The images are split over a thread pool (OpenCV releases the GIL) and
+    the results are written into `out`. The images are converted with
+    `cv2.convertScaleAbs` (scaled by alpha, shifted by beta, rounded, abs and
+    saturated to 0-255) first.
+
+    Args:
+        images (np.ndarray): The (N, H, W, C) images (C = 1 or 3).
+        clip_limit (float): The CLAHE clip limit.
+        tile_grid_size (tuple): The CLAHE tile grid size.
+        out (np.ndarray): Optional output array (can be `images` itself). A new
+            uint8 array is allocated if None.
+        workers (int): The number of threads (defaults to the cpu count).
+        luminance (bool): Run CLAHE once on the luminance (Y of YCrCb) instead
+            of once per channel. For grayscale images stored as RGB this gives
+            the same result at a third of the CLAHE cost.
+        alpha (float): The scale applied before CLAHE (fused into the uint8 conversion).
+        beta (float): The shift applied after `alpha`.
+
+    Returns:
+        The equalized images (`out`).
+    """
+    if out is None:
+        out = np.empty(images.shape, dtype=np.uint8)
+    workers = min(workers or os.cpu_count() or 1, len(images)) or 1
+    bounds = np.linspace(0, len(images), workers + 1).astype(int)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_clahe_range, images, out, start, end, clip_limit, tile_grid_size, luminance, alpha, beta)
+            for start, end in zip(bounds[:-1], bounds[1:])
+        ]
+        for future in futures:
+            future.result()
+    return out
+
+
+def clahe_normalize(images, clip_limit=0.5, tile_grid_size=(8, 8), out=None, buffer=None, workers=None, luminance=False):
+    """Fused Rev2 subset normalization (0-255 min-max -> CLAHE -> 0-1 min-max).
+
+    Gives the same result (up to the rounding of a few pixels to uint8) as the chain
+    `normalize_TO_RANGE(Z_SCORE_normalize(apply_clahe_rgb_array(normalize_TO_RANGE(x, 0, 255)) / 255), 0, 1)`
+    without its four full size float temporaries:
+    - The 0-255 min-max is fused into the uint8 conversion of `clahe_batch`.
+    - The z-score and the `/ 255` are positive affine maps, so the last
+      min-max cancels them and only the min-max of the CLAHE output is left.
+
+    Args:
+        images (np.ndarray): The (N, H, W, C) images.
+        clip_limit (float): The CLAHE clip limit.
+        tile_grid_size (tuple): The CLAHE tile grid size.
+        out (np.ndarray): Optional float32 output buffer (reused across calls).
+        buffer (np.ndarray): Optional uint8 CLAHE buffer (reused across calls).
+        workers (int): The number of CLAHE threads (see `clahe_batch`).
+        luminance (bool): Run CLAHE on the luminance only (see `clahe_batch`).
+
+    Returns:
+        The float32 images in the 0-1 range (`out`).
+    """
+    low, high = float(images.min()), float(images.max())
+    scale = 255 / max(high - low, 1e-7)
+    buffer = clahe_batch(
+        images, clip_limit, tile_grid_size, out=buffer, workers=workers, luminance=luminance, alpha=scale, beta=-low * scale
+    )
+    low, high = int(buffer.min()), int(buffer.max())
+    if out is None:
+        out = np.empty(images.shape, dtype=np.float32)
+    np.subtract(buffer, np.float32(low), out=out)
+    out *= np.float32(1 / max(high - low, 1))
+    return out
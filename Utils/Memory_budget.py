@@ -0,0 +1,92 @@
+import gc
+
+import psutil
+
+from Utils.print_color_V1_OLD import print_Color
+
+_GB = 1024**3
+
+
+class MemoryBudget:
+    """Runs a memory cleanup only when the host RSS is over a budget.
+
+    Replaces the unconditional per epoch cleanup (`Cache_clear.cmd`,
+    `gc.collect()` and `tf.keras.backend.clear_session()`, which also forces
+    the graphs to be retraced). `check` compares the process RSS with the
+    budget and, only if it is over, runs `gc.collect()` and the registered
+    cleanups and reports how much each of them actually freed. The sizes of
+    the tracked buffers (e.g. the reused subset arrays) are reported too, so
+    the RSS can be compared with what the pipeline itself holds.
+
+    Args:
+        budget_gb (float): The RSS budget in GB (None for `budget_fraction` of the total RAM).
+        budget_fraction (float): The budget as a fraction of the total RAM (if `budget_gb` is None).
+        verbose (bool): Print the cleanup reports.
+    """
+
+    def __init__(self, budget_gb=None, budget_fraction=0.8, verbose=True):
+        self.budget = budget_gb * _GB if budget_gb is not None else psutil.virtual_memory().total * budget_fraction
+        self.verbose = verbose
+        self.cleanup_count = 0
+        self._process = psutil.Process()
+        self._tracked = {}
+        self._cleanups = {"gc.collect": gc.collect}
+
+    def rss(self):
+        """Returns the process RSS in bytes."""
+        return self._process.memory_info().rss
+
+    def track(self, name, size_fn):
+        """Tracks the size of a buffer.
+
+        Args:
+            name (str): The name in the reports.
+            size_fn (callable): Returns the current size in bytes (e.g. `lambda: subset_buffers.nbytes`).
+        """
+        self._tracked[name] = size_fn
+
+    def add_cleanup(self, name, cleanup_fn):
+        """Adds a cleanup (run after `gc.collect()`, in the order they were added)."""
+        self._cleanups[name] = cleanup_fn
+
+    def tracked_sizes(self):
+        """Returns {name: bytes} of the tracked buffers."""
+        return {name: size_fn() for name, size_fn in self._tracked.items()}
+
+    def check(self, force=False):
+        """Runs the cleanups if the RSS is over the budget.
+
+        Args:
+            force (bool): Run the cleanups even if the RSS is under the budget.
+
+        Returns:
+            {name: freed bytes} of each cleanup (empty if none was run).
+        """
+        rss = self.rss()
+        if rss <= self.budget and not force:
+            return {}
+        self.cleanup_count += 1
+        freed = {}
+        for name, cleanup_fn in self._cleanups.items():
+            cleanup_fn()
+            new_rss = self.rss()
+            freed[name] = rss - new_rss
+            rss = new_rss
+        if self.verbose:
+            self.report(freed)
+        return freed
+
+    def report(self, freed=None):
+        """Prints the RSS, the budget, the tracked buffer sizes and (optionally) the freed memory."""
+        tracked = ", ".join(f"{name}: {size / _GB:.2f}GB" for name, size in self.tracked_sizes().items())
+        print_Color(
+            f"~*(RAM)~*[rss: {self.rss() / _GB:.2f}GB, budget: {self.budget / _GB:.2f}GB{', ' + tracked if tracked else ''}]",
+            ["green", "cyan"],
+            advanced_mode=True,
+        )
+        if freed:
+            print_Color(
+                "~*(RAM cleanup)~*[" + ", ".join(f"{name}: {size / _GB:.3f}GB" for name, size in freed.items()) + "]",
+                ["yellow", "cyan"],
+                advanced_mode=True,
+            )
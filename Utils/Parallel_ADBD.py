@@ -0,0 +1,125 @@
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from Utils.Img_proc import block_noise_batch, clahe_batch
+
+# The shared memory blocks of the returned arrays (freed by `release_buffers`)
+_shared_blocks = []
+# Per worker process state (set by `_init_worker`)
+_worker = {}
+
+
+def _init_worker(shm_name, shape, dtype, num_samples, datagen):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker["shm"] = shm
+    _worker["x"] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    _worker["num_samples"] = num_samples
+    _worker["datagen"] = datagen
+
+
+def _augment_chunk(round_id, start, end, clip_limit, noise_profile, grain, clahe_luminance, seed):
+    """Augments the original images [start:end] into the slot of round `round_id`."""
+    x, datagen = _worker["x"], _worker["datagen"]
+    offset = (round_id + 1) * _worker["num_samples"]
+    dst = x[offset + start : offset + end]
+    # ImageDataGenerator draws from the global numpy rng
+    np.random.seed(seed.generate_state(1)[0])
+    for i in range(end - start):
+        dst[i] = datagen.random_transform(x[start + i])
+    if noise_profile is not None:
+        block_noise_batch(dst, noise_profile, grain=grain, rng=np.random.default_rng(seed), out=dst)
+    np.clip(dst, 0, 255, out=dst)
+    clahe_batch(dst, clip_limit, out=dst, workers=1, luminance=clahe_luminance)
+    return end - start
+
+
+def release_buffers():
+    """Frees the shared memory of the returned arrays that are no longer used.
+
+    Returns:
+        The number of freed bytes.
+    """
+    freed = 0
+    for block in list(_shared_blocks):
+        shm, array_ref = block
+        # The views of the array keep it alive, so a dead ref means the memory is unused
+        if array_ref() is None:
+            freed += shm.size
+            shm.close()
+            shm.unlink()
+            _shared_blocks.remove(block)
+    return freed
+
+
+def generate_adbd(
+    x, y, datagen, clip_limits, noise_profile="V1", grain=True, clahe_luminance=False, workers=None, chunk_size=64, seed=None
+):
+    """Generates the ADBD augmented rounds of a dataset on a process pool.
+
+    The output is one preallocated `(1 + len(clip_limits)) * N` shared memory
+    buffer. The original images are copied into the first N slots once and
+    every worker writes its augmented chunk (`datagen.random_transform` ->
+    block noise -> clip -> CLAHE) straight into its own slot, so no round is
+    ever concatenated. Each chunk gets its own seed (from `seed`).
+
+    Every round augments the original images, so the output has
+    `(1 + rounds) * N` samples (the old loop doubled the data every round,
+    re-augmenting the earlier rounds, for `2^rounds * N` samples).
+
+    The shared memory is freed by `release_buffers` once the returned array
+    (and its views) are deleted.
+
+    Args:
+        x (np.ndarray): The (N, H, W, C) images in the 0-255 range.
+        y (np.ndarray): The labels.
+        datagen (ImageDataGenerator): The augmentation generator (must be
+            picklable, so no lambda `preprocessing_function`).
+        clip_limits (list): The CLAHE clip limit of each round (one round per value).
+        noise_profile (str): The block noise profile (see
+            `Utils.Img_proc.NOISE_PROFILES`) or None for no noise.
+        grain (bool): Add grain noise.
+        clahe_luminance (bool): Run CLAHE on the luminance only (see `clahe_batch`).
+        workers (int): The number of worker processes (defaults to the cpu count).
+        chunk_size (int): The number of images per task.
+        seed (int): Optional random seed.
+
+    Returns:
+        A tuple (x, y) with the original images followed by the augmented rounds.
+    """
+    release_buffers()
+    rounds, num_samples = len(clip_limits), len(x)
+    shape = ((1 + rounds) * num_samples,) + x.shape[1:]
+    shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * x.dtype.itemsize, 1))
+    x_out = np.ndarray(shape, dtype=x.dtype, buffer=shm.buf)
+    x_out[:num_samples] = x
+    tasks = [
+        (round_id, start, min(start + chunk_size, num_samples), clip_limit)
+        for round_id, clip_limit in enumerate(clip_limits)
+        for start in range(0, num_samples, chunk_size)
+    ]
+    seeds = np.random.SeedSequence(seed).spawn(len(tasks))
+    workers = min(workers or os.cpu_count() or 1, len(tasks)) or 1
+    done = 0
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(shm.name, shape, x.dtype, num_samples, datagen)
+        ) as executor:
+            futures = [
+                executor.submit(_augment_chunk, *task, noise_profile, grain, clahe_luminance, task_seed)
+                for task, task_seed in zip(tasks, seeds)
+            ]
+            for future in as_completed(futures):
+                done += future.result()
+                print(f">   Generating ADB [{done}/{rounds * num_samples}] ({workers} workers)...", end="\r")
+        print()
+    except BaseException:
+        del x_out
+        shm.close()
+        shm.unlink()
+        raise
+    _shared_blocks.append((shm, weakref.ref(x_out)))
+    return x_out, np.concatenate([np.asarray(y)] * (1 + rounds))
@@ -0,0 +1,86 @@
+import json
+import os
+
+import numpy as np
+
+
+class RunningStats:
+    """Streaming per-channel mean/std (Welford / Chan et al. merge).
+
+    Replaces `ImageDataGenerator.fit` for `featurewise_center` and
+    `featurewise_std_normalization`: every subset updates the statistics
+    in small chunks (no augmentation rounds and no full size temporaries)
+    and only the counts, means and M2 sums are saved (a tiny JSON file
+    instead of the pickled generator).
+
+    Args:
+        channels (int): The number of image channels.
+    """
+
+    def __init__(self, channels=3):
+        self.channels = channels
+        self.count = 0
+        self._mean = np.zeros(channels, dtype=np.float64)
+        self._m2 = np.zeros(channels, dtype=np.float64)
+
+    def update(self, images, scale=1, chunk_size=32):
+        """Adds images to the statistics.
+
+        Args:
+            images (np.ndarray): The (N, H, W, C) images (or a `ShardedArray`).
+            scale (float): The images are counted as `images * scale` (255 for 0-1 data).
+            chunk_size (int): The number of images per merged chunk.
+
+        Returns:
+            self.
+        """
+        for start in range(0, len(images), chunk_size):
+            chunk = np.asarray(images[start : start + chunk_size]).reshape(-1, self.channels)
+            count = chunk.shape[0]
+            mean = chunk.mean(axis=0, dtype=np.float64) * scale
+            m2 = chunk.var(axis=0, dtype=np.float64) * count * scale**2
+            total = self.count + count
+            delta = mean - self._mean
+            self._mean += delta * (count / total)
+            self._m2 += m2 + delta**2 * (self.count * count / total)
+            self.count = total
+        return self
+
+    @property
+    def mean(self):
+        return self._mean.copy()
+
+    @property
+    def std(self):
+        return np.sqrt(self._m2 / max(self.count, 1))
+
+    def apply(self, datagen):
+        """Sets the feature-wise mean/std of an `ImageDataGenerator` (same shapes as `fit`)."""
+        datagen.mean = self.mean.reshape(1, 1, self.channels).astype(np.float32)
+        datagen.std = self.std.reshape(1, 1, self.channels).astype(np.float32)
+        return datagen
+
+    def get_state(self):
+        """Returns the statistics (JSON serializable)."""
+        return {"channels": self.channels, "count": self.count, "mean": self._mean.tolist(), "m2": self._m2.tolist()}
+
+    def set_state(self, state):
+        """Restores the statistics from `get_state`."""
+        self.channels = state["channels"]
+        self.count = state["count"]
+        self._mean = np.asarray(state["mean"], dtype=np.float64)
+        self._m2 = np.asarray(state["m2"], dtype=np.float64)
+        return self
+
+    def save(self, path):
+        """Saves the statistics to a JSON file (written to a temp file first)."""
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.get_state(), f)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        """Loads statistics saved with `save`."""
+        with open(path) as f:
+            state = json.load(f)
+        return cls(state["channels"]).set_state(state)
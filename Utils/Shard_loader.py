@@ -0,0 +1,338 @@
+import json
+import os
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+from Utils.print_color_V1_OLD import print_Color
+from Utils.Uint8_data import uint8_to_float
+
+# Same image formats that keras `flow_from_directory` accepts
+IMG_FORMATS = (".png", ".jpg", ".jpeg", ".bmp", ".ppm", ".tif", ".tiff")
+
+
+def list_class_files(directory):
+    """Lists the images of a class-folder dataset.
+
+    Uses the same layout and label order as keras `flow_from_directory`
+    (one sub folder per class, classes sorted by name).
+
+    Args:
+        directory (str): The dataset directory.
+
+    Returns:
+        A tuple (files, labels, classes) with the image paths, their
+        integer labels and the class names.
+    """
+    classes = sorted(name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name)))
+    files, labels = [], []
+    for label, class_name in enumerate(classes):
+        for root, _, fnames in sorted(os.walk(os.path.join(directory, class_name))):
+            for fname in sorted(fnames):
+                if fname.lower().endswith(IMG_FORMATS):
+                    files.append(os.path.join(root, fname))
+                    labels.append(label)
+    return files, labels, classes
+
+
+def load_image(path, target_size, color_mode="rgb"):
+    """Loads and resizes an image as uint8.
+
+    Args:
+        path (str): The image path.
+        target_size (tuple): The (height, width) to resize to.
+        color_mode (str): 'rgb' or 'grayscale'.
+
+    Returns:
+        A uint8 array of shape (height, width, 3) or (height, width, 1).
+    """
+    # np.fromfile + imdecode also works with non-ascii paths on Windows
+    return decode_image(np.fromfile(path, dtype=np.uint8), target_size, color_mode, path)
+
+
+def decode_image(data, target_size, color_mode="rgb", path="<bytes>"):
+    """Decodes and resizes an encoded image buffer as uint8.
+
+    Args:
+        data (np.ndarray): The encoded image bytes as a uint8 array.
+        target_size (tuple): The (height, width) to resize to.
+        color_mode (str): 'rgb' or 'grayscale'.
+        path (str): The image path (only used in the error message).
+
+    Returns:
+        A uint8 array of shape (height, width, 3) or (height, width, 1).
+    """
+    if color_mode == "grayscale":
+        img = cv2.imdecode(data, cv2.IMREAD_GRAYSCALE)
+    else:
+        img = cv2.cvtColor(cv2.imdecode(data, cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+    if img is None:
+        raise OSError(f"Failed to decode image: {path}")
+    if img.shape[:2] != tuple(target_size):
+        # Nearest is the keras `load_img` default
+        img = cv2.resize(img, (target_size[1], target_size[0]), interpolation=cv2.INTER_NEAREST)
+    if img.ndim == 2:
+        img = img[..., np.newaxis]
+    return img
+
+
+class ShardedArray:
+    """A read-only, lazily loaded view over on-disk uint8 image shards.
+
+    Supports `len`, `.shape` and indexing with an int, a slice or an index
+    array (like `x_train[subset_indices]`). Only the requested images are
+    read from the memory-mapped shards.
+
+    Args:
+        shard_paths (list): The shard .npy files or already open arrays
+            (all but the last one full).
+        shard_size (int): The number of images per full shard.
+        num_samples (int): The total number of images.
+        img_shape (tuple): The (height, width, channels) of an image.
+        scale (float): If not None the gathered images are returned as
+            float32 multiplied by `scale`. If None they stay uint8.
+        transform (callable): Optional per image transform applied to each
+            gathered image (a float32 0-255 array, before `scale`), so a
+            random transform is redrawn on every read. It runs in a per
+            image Python loop, so it costs read throughput (like the
+            `ImageDataGenerator` it usually comes from).
+    """
+
+    def __init__(self, shard_paths, shard_size, num_samples, img_shape, scale=None, transform=None):
+        self.shard_paths = shard_paths
+        self.shard_size = shard_size
+        self.num_samples = num_samples
+        self.img_shape = tuple(img_shape)
+        self.scale = scale
+        self.transform = transform
+        self._shards = {}
+
+    @property
+    def shape(self):
+        return (self.num_samples,) + self.img_shape
+
+    @property
+    def dtype(self):
+        return np.dtype("uint8") if self.scale is None else np.dtype("float32")
+
+    def __len__(self):
+        return self.num_samples
+
+    def _shard(self, shard_id):
+        if shard_id not in self._shards:
+            shard = self.shard_paths[shard_id]
+            self._shards[shard_id] = np.load(shard, mmap_mode="r") if isinstance(shard, str) else shard
+        return self._shards[shard_id]
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self[np.array([index])][0]
+        if isinstance(index, slice):
+            index = np.arange(self.num_samples)[index]
+        return self.take(index)
+
+    def take(self, index, out=None):
+        """Gathers the images of an index array (like `np.take(x, index, axis=0, out=out)`).
+
+        Args:
+            index (np.ndarray): The image indices.
+            out (np.ndarray): Optional (len(index), H, W, C) array of `self.dtype`
+                to gather into (reused instead of allocating a new one).
+
+        Returns:
+            The gathered images (`out` if given).
+        """
+        index = np.asarray(index, dtype=np.int64)
+        if out is None:
+            out = np.empty((len(index),) + self.img_shape, dtype=self.dtype)
+        shard_ids = index // self.shard_size
+        offsets = index % self.shard_size
+        for shard_id in np.unique(shard_ids):
+            mask = shard_ids == shard_id
+            out[mask] = self._shard(shard_id)[offsets[mask]]
+        if self.transform is not None:
+            for i in range(len(out)):
+                img = self.transform(out[i].astype(np.float32))
+                out[i] = np.clip(np.rint(img), 0, 255) if self.scale is None else img
+        if self.scale is not None:
+            out *= self.scale
+        return out
+
+    def batches(self, y, batch_size, shuffle=True, seed=None):
+        """Yields (x, y) batches lazily, one shard in memory at a time.
+
+        The shard order and the order inside each shard are shuffled, so
+        each batch only reads from one memory-mapped shard.
+
+        Args:
+            y (np.ndarray): The labels.
+            batch_size (int): The batch size.
+            shuffle (bool): Shuffle the shard and image order.
+            seed: Optional random seed (or a `np.random.Generator` to keep drawing from).
+        """
+        rng = np.random.default_rng(seed)
+        shard_count = -(-self.num_samples // self.shard_size)
+        for shard_id in rng.permutation(shard_count) if shuffle else range(shard_count):
+            start = shard_id * self.shard_size
+            index = np.arange(start, min(start + self.shard_size, self.num_samples))
+            if shuffle:
+                rng.shuffle(index)
+            for i in range(0, len(index), batch_size):
+                batch_index = index[i : i + batch_size]
+                yield self.take(batch_index), y[batch_index]
+
+    def close(self):
+        """Closes the open shard memory maps."""
+        self._shards = {}
+
+
+def sharded_dataset(x, y, batch_size=32, shuffle=True, seed=None, uint8_scale=1 / 255):
+    """Makes a batched tf.data pipeline that streams a `ShardedArray` (for `model.fit`).
+
+    The batches come from `ShardedArray.batches` (reshuffled each
+    iteration), so only the current shard is read instead of the whole set
+    being converted to a tensor. uint8 batches are cast to float32 and
+    scaled by `uint8_scale` (see `uint8_dataset`).
+
+    Args:
+        x (ShardedArray): The images.
+        y (np.ndarray): The labels.
+        batch_size (int): The batch size.
+        shuffle (bool): Shuffle the shard and image order each iteration.
+        seed (int): Optional random seed.
+        uint8_scale (float): The scale of uint8 images.
+
+    Returns:
+        A `tf.data.Dataset` yielding (x, y) batches.
+    """
+    y = np.asarray(y)
+    rng = np.random.default_rng(seed)
+    dataset = tf.data.Dataset.from_generator(
+        lambda: x.batches(y, batch_size, shuffle=shuffle, seed=rng),
+        output_signature=(
+            tf.TensorSpec((None,) + x.img_shape, tf.as_dtype(x.dtype)),
+            tf.TensorSpec((None,) + y.shape[1:], tf.as_dtype(y.dtype)),
+        ),
+    )
+    # The batches never span two shards (keras needs the count for the steps per epoch)
+    full_shards, last_shard = divmod(len(x), x.shard_size)
+    num_batches = full_shards * -(-x.shard_size // batch_size) + -(-last_shard // batch_size)
+    dataset = dataset.apply(tf.data.experimental.assert_cardinality(num_batches))
+    if x.dtype == np.uint8:
+        dataset = dataset.map(lambda x_b, y_b: (uint8_to_float(x_b, uint8_scale), y_b), num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+class ShardedImageDataset:
+    """Streams a class-folder image dataset through fixed-size on-disk shards.
+
+    The images are decoded and resized one shard at a time and saved as
+    uint8 .npy shards, so the peak memory depends on `shard_size` and not
+    on the dataset size. Existing shards are reused if the file list and
+    settings did not change. The shards only hold the deterministic
+    decode/resize, `transform` is applied when the images are read.
+
+    Args:
+        directory (str): The dataset directory (one sub folder per class).
+        shard_dir (str): Where to store the shards.
+        img_res (list): The [height, width, channels] of the images.
+        shard_size (int): The number of images per shard.
+        num_classes (int): Number of classes (for the one-hot labels).
+        categorical (bool): Return one-hot labels if True.
+        transform (callable): Optional per image transform applied on every
+            read of `images` (e.g. `ImageDataGenerator.random_transform`).
+    """
+
+    def __init__(self, directory, shard_dir, img_res, shard_size=2048, num_classes=2, categorical=True, transform=None):
+        self.directory = directory
+        self.shard_dir = shard_dir
+        self.img_res = list(img_res)
+        self.shard_size = shard_size
+        self.num_classes = num_classes
+        self.categorical = categorical
+        self.transform = transform
+        self.color_mode = "grayscale" if self.img_res[2] == 1 else "rgb"
+        self.files, self.labels, self.classes = list_class_files(directory)
+        self.meta_path = os.path.join(shard_dir, "meta.json")
+
+    def __len__(self):
+        return len(self.files)
+
+    def _meta(self):
+        return {
+            "img_res": self.img_res,
+            "shard_size": self.shard_size,
+            "files": self.files,
+            "labels": self.labels,
+            "classes": self.classes,
+        }
+
+    def _shard_path(self, shard_id):
+        return os.path.join(self.shard_dir, f"shard_{shard_id:05d}.npy")
+
+    @property
+    def shard_count(self):
+        return -(-len(self.files) // self.shard_size)
+
+    def is_built(self):
+        """Returns True if the shards on disk match the current dataset."""
+        if not os.path.exists(self.meta_path):
+            return False
+        with open(self.meta_path) as f:
+            if json.load(f) != self._meta():
+                return False
+        return all(os.path.exists(self._shard_path(i)) for i in range(self.shard_count))
+
+    def build(self, rebuild=False):
+        """Decodes the dataset into shards (skipped if already up to date).
+
+        Args:
+            rebuild (bool): Rebuild the shards even if they are up to date.
+        """
+        if not rebuild and self.is_built():
+            print_Color(f"~*Using existing shards: ~*{self.shard_dir}", ["normal", "green"], advanced_mode=True)
+            return
+        os.makedirs(self.shard_dir, exist_ok=True)
+        if os.path.exists(self.meta_path):
+            os.remove(self.meta_path)
+        buffer = np.empty((self.shard_size,) + tuple(self.img_res), dtype=np.uint8)
+        for shard_id in range(self.shard_count):
+            print(f">   Building shard [{shard_id + 1}/{self.shard_count}]...", end="\r")
+            start = shard_id * self.shard_size
+            shard_files = self.files[start : start + self.shard_size]
+            for i, path in enumerate(shard_files):
+                buffer[i] = load_image(path, self.img_res[:2], self.color_mode)
+            np.save(self._shard_path(shard_id), buffer[: len(shard_files)])
+        print()
+        # meta.json is written last so an interrupted build is never reused
+        with open(self.meta_path, "w") as f:
+            json.dump(self._meta(), f)
+
+    def images(self, scale=None):
+        """Returns a lazy `ShardedArray` over the images (with `transform` applied on read).
+
+        Args:
+            scale (float): If not None the images are returned as float32
+                multiplied by `scale` (e.g. 1 / 255). If None they stay uint8.
+        """
+        paths = [self._shard_path(i) for i in range(self.shard_count)]
+        return ShardedArray(paths, self.shard_size, len(self.files), self.img_res, scale=scale, transform=self.transform)
+
+    def targets(self):
+        """Returns the labels (one-hot if `categorical`)."""
+        labels = np.asarray(self.labels, dtype=np.int64)
+        if self.categorical:
+            return np.eye(self.num_classes, dtype=np.float32)[labels]
+        return labels.astype(np.float32)
+
+    def batches(self, batch_size, shuffle=True, scale=None, seed=None):
+        """Yields (x, y) batches lazily, one shard in memory at a time (see `ShardedArray.batches`).
+
+        Args:
+            batch_size (int): The batch size.
+            shuffle (bool): Shuffle the shard and image order.
+            scale (float): See `images`.
+            seed (int): Optional random seed.
+        """
+        return self.images(scale=scale).batches(self.targets(), batch_size, shuffle=shuffle, seed=seed)
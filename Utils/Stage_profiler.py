@@ -0,0 +1,122 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psutil
+import tensorflow as tf
+
+_GB = 1024**3
+_CSV_COLUMNS = ["epoch", "stage", "time_sec", "images", "images_per_sec", "peak_rss_gb"]
+
+
+class StageProfiler:
+    """Records the wall time, throughput and peak RSS of the training loop stages.
+
+    Wrap each stage in `stage` (or `start` / `stop`). The records of an
+    epoch are written by `end_epoch` to `<path_prefix>.csv` and
+    `<path_prefix>.jsonl` and (if `file_writer` is given) as TensorBoard
+    scalars. Stages of different threads (e.g. a prefetched subset) can be
+    open at the same time, each one is recorded under its own epoch. The
+    peak RSS is sampled on a background thread while any stage is open.
+
+    Args:
+        path_prefix (str): The CSV/JSONL path without the extension (None to not write files).
+        file_writer (tf.summary.SummaryWriter): Optional TensorBoard writer.
+        sample_interval (float): The RSS sampling interval in seconds.
+    """
+
+    def __init__(self, path_prefix=None, file_writer=None, sample_interval=0.05):
+        self.path_prefix = path_prefix
+        self.file_writer = file_writer
+        self.sample_interval = sample_interval
+        self.records = {}
+        self._process = psutil.Process()
+        self._open = {}
+        self._lock = threading.Lock()
+        self._sampler = None
+
+    def _sample(self):
+        while True:
+            with self._lock:
+                if not self._open:
+                    self._sampler = None
+                    return
+                rss = self._process.memory_info().rss
+                for token in self._open.values():
+                    token["peak_rss"] = max(token["peak_rss"], rss)
+            time.sleep(self.sample_interval)
+
+    def start(self, name, epoch, images=0):
+        """Starts timing a stage.
+
+        Args:
+            name (str): The stage name.
+            epoch (int): The epoch the stage belongs to.
+            images (int): The number of processed images (for the images/sec).
+
+        Returns:
+            The token for `stop`.
+        """
+        token = {"name": name, "epoch": epoch, "images": images, "peak_rss": self._process.memory_info().rss}
+        with self._lock:
+            self._open[id(token)] = token
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, name="StageProfiler", daemon=True)
+                self._sampler.start()
+        token["start_time"] = time.perf_counter()
+        return token
+
+    def stop(self, token):
+        """Stops timing a stage (started with `start`) and records it."""
+        elapsed = time.perf_counter() - token["start_time"]
+        rss = self._process.memory_info().rss
+        with self._lock:
+            self._open.pop(id(token), None)
+            self.records.setdefault(token["epoch"], []).append({
+                "epoch": token["epoch"],
+                "stage": token["name"],
+                "time_sec": elapsed,
+                "images": token["images"],
+                "images_per_sec": token["images"] / elapsed if token["images"] and elapsed > 0 else 0.0,
+                "peak_rss_gb": max(token["peak_rss"], rss) / _GB,
+            })
+
+    @contextmanager
+    def stage(self, name, epoch, images=0):
+        """Times the code in the `with` block as a stage (see `start`)."""
+        token = self.start(name, epoch, images)
+        try:
+            yield token
+        finally:
+            self.stop(token)
+
+    def end_epoch(self, epoch):
+        """Writes (and forgets) the records of an epoch.
+
+        Returns:
+            The records of the epoch (a list of dicts).
+        """
+        with self._lock:
+            records = self.records.pop(epoch, [])
+        if self.path_prefix is not None and records:
+            os.makedirs(os.path.dirname(self.path_prefix) or ".", exist_ok=True)
+            csv_path = f"{self.path_prefix}.csv"
+            new_file = not os.path.exists(csv_path)
+            with open(csv_path, "a") as f:
+                if new_file:
+                    f.write(",".join(_CSV_COLUMNS) + "\n")
+                for record in records:
+                    f.write(",".join(str(record[column]) for column in _CSV_COLUMNS) + "\n")
+            with open(f"{self.path_prefix}.jsonl", "a") as f:
+                for record in records:
+                    f.write(json.dumps(record) + "\n")
+        if self.file_writer is not None and records:
+            with self.file_writer.as_default():
+                for record in records:
+                    tf.summary.scalar(f"Stages time (sec)/{record['stage']}", record["time_sec"], step=epoch)
+                    tf.summary.scalar(f"Stages peak RSS (GB)/{record['stage']}", record["peak_rss_gb"], step=epoch)
+                    if record["images"]:
+                        tf.summary.scalar(f"Stages images per sec/{record['stage']}", record["images_per_sec"], step=epoch)
+        return records
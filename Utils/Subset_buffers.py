@@ -0,0 +1,91 @@
+import numpy as np
+
+
+class SubsetBuffers:
+    """Fixed size subset arrays that are reused by every subset.
+
+    Holds `slots` sets of named `(subset_size, ...)` buffers. A buffer is
+    allocated the first time it is requested and then refilled in place, so
+    the memory use stays flat across the epochs instead of allocating (and
+    garbage collecting) new subset arrays each time. Use one slot per
+    subset that can be alive at once (e.g. 2 with `SubsetPrefetcher`).
+
+    Args:
+        subset_size (int): The number of samples per subset.
+        slots (int): The number of buffer sets.
+    """
+
+    def __init__(self, subset_size, slots=2):
+        self.subset_size = subset_size
+        self.slots = slots
+        self._buffers = [{} for _ in range(slots)]
+
+    def get(self, slot, name, sample_shape, dtype=np.float32):
+        """Returns the named buffer of a slot (reallocated only if its shape or dtype changed).
+
+        Args:
+            slot (int): The slot (taken modulo `slots`, so the epoch can be passed).
+            name (str): The buffer name.
+            sample_shape (tuple): The shape of one sample (e.g. (H, W, C)).
+            dtype: The buffer dtype.
+        """
+        buffers = self._buffers[slot % self.slots]
+        shape = (self.subset_size,) + tuple(sample_shape)
+        buffer = buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != np.dtype(dtype):
+            buffer = buffers[name] = np.empty(shape, dtype=dtype)
+        return buffer
+
+    def take(self, slot, name, data, indices):
+        """Gathers `data[indices]` into the named buffer of a slot.
+
+        Args:
+            slot (int): The slot (see `get`).
+            name (str): The buffer name.
+            data (np.ndarray): The array to gather from (or a `ShardedArray`).
+            indices (np.ndarray): The `subset_size` indices.
+
+        Returns:
+            The filled buffer.
+        """
+        if len(indices) != self.subset_size:
+            raise ValueError(f"Expected {self.subset_size} indices, but got {len(indices)}.")
+        buffer = self.get(slot, name, data.shape[1:], data.dtype)
+        if isinstance(data, np.ndarray):
+            np.take(data, indices, axis=0, out=buffer)
+        else:
+            data.take(indices, out=buffer)
+        return buffer
+
+    @property
+    def nbytes(self):
+        """The total size of the allocated buffers."""
+        return sum(buffer.nbytes for buffers in self._buffers for buffer in buffers.values())
+
+    def clear(self):
+        """Frees all the buffers."""
+        self._buffers = [{} for _ in range(self.slots)]
+
+
+def flow_into(datagen, x, out, scale=1):
+    """Augments images into a preallocated array.
+
+    Same as `datagen.flow(x * scale, shuffle=False, batch_size=len(x)).next()[0]`
+    (`random_transform` -> `standardize` per image) without the scaled copy of
+    `x` and the new batch array. `out` can be `x` itself (if float).
+
+    Args:
+        datagen (ImageDataGenerator): The (fitted) augmentation generator.
+        x (np.ndarray): The (N, H, W, C) images.
+        out (np.ndarray): The (N, H, W, C) float output array.
+        scale (float): Multiplied with the images first (255 for 0-1 data).
+
+    Returns:
+        `out`.
+    """
+    for i in range(len(x)):
+        image = x[i].astype(out.dtype)
+        if scale != 1:
+            image *= scale
+        out[i] = datagen.standardize(datagen.random_transform(image))
+    return out
@@ -0,0 +1,77 @@
+import queue
+import sys
+import threading
+import time
+
+
+class SubsetPrefetcher:
+    """Prepares the next training subsets in a background thread.
+
+    `prepare_fn(key)` is called for each key in order while the current
+    subset trains. Each prepared subset holds one of `slots` slots until
+    `release` is called, so at most `slots` subsets (the one training and
+    the next one) are in memory at once.
+
+    Args:
+        prepare_fn (callable): Prepares the subset of a key (e.g. the epoch).
+        keys (iterable): The keys to prepare, in order.
+        slots (int): The max number of prepared subsets alive at once.
+    """
+
+    def __init__(self, prepare_fn, keys, slots=2):
+        self.prepare_fn = prepare_fn
+        self.wait_time = 0.0
+        self._keys = iter(keys)
+        self._slots = threading.Semaphore(slots)
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="SubsetPrefetcher", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        key, done = None, False
+        try:
+            for key in self._keys:
+                # Wait for a free slot (checking for close)
+                while not self._slots.acquire(timeout=0.2):
+                    if self._stop.is_set():
+                        done = True
+                        return
+                if self._stop.is_set():
+                    done = True
+                    return
+                self._queue.put((key, self.prepare_fn(key), None))
+            self._queue.put(None)
+            done = True
+        finally:
+            if not done:
+                # prepare_fn failed, `get` raises it (chained) instead of waiting forever
+                err = RuntimeError(f"Preparing the subset [{key}] failed.")
+                err.__cause__ = sys.exc_info()[1]
+                self._queue.put((key, None, err))
+
+    def get(self):
+        """Returns the next prepared (key, subset), waiting for it if needed.
+
+        Raises:
+            StopIteration: If all the keys were prepared and returned.
+            RuntimeError: If `prepare_fn` failed (caused by its error).
+        """
+        start_time = time.time()
+        entry = self._queue.get()
+        self.wait_time = time.time() - start_time
+        if entry is None:
+            raise StopIteration
+        key, subset, err = entry
+        if err is not None:
+            raise err
+        return key, subset
+
+    def release(self):
+        """Frees the slot of the oldest subset (call when it is no longer used)."""
+        self._slots.release()
+
+    def close(self):
+        """Stops the background thread (the subset being prepared is finished first)."""
+        self._stop.set()
+        self._thread.join()
@@ -0,0 +1,78 @@
+import numpy as np
+
+
+class AdvSubsetSampler:
+    """Least recently used first subset sampler (AdvSubsetC).
+
+    The samples are kept in one random permutation that is read with a
+    cursor. Each subset is the next `subset_size` indices, so the samples
+    that were used the longest time ago always come first and every sample
+    is used once before any sample is used twice. When the cursor wraps
+    around, a new permutation is drawn for the next cycle, so the subsets
+    differ from cycle to cycle.
+    `sample` costs O(subset_size) (O(num_samples) once per cycle) instead
+    of rebuilding the sets of available and chosen indices.
+
+    Args:
+        num_samples (int): The dataset size.
+        subset_size (int): The number of indices per subset.
+        seed (int): Optional random seed.
+    """
+
+    def __init__(self, num_samples, subset_size, seed=None):
+        if subset_size > num_samples:
+            raise ValueError(f"subset_size ({subset_size}) is larger than the dataset ({num_samples}).")
+        self.num_samples = num_samples
+        self.subset_size = subset_size
+        self.rng = np.random.default_rng(seed)
+        self.reset()
+
+    def reset(self):
+        """Starts over with a new permutation (forgets the usage history)."""
+        self.order = self.rng.permutation(self.num_samples)
+        self.cursor = 0
+
+    def sample(self):
+        """Returns the next subset as an int64 index array."""
+        end = self.cursor + self.subset_size
+        if end < self.num_samples:
+            indices = self.order[self.cursor : end].copy()
+            self.cursor = end
+            return indices
+        # Wrap around: the rest of this cycle + the start of a new permutation
+        tail = self.order[self.cursor :].copy()
+        head_size = end - self.num_samples
+        self._reshuffle(tail, head_size)
+        self.cursor = head_size
+        return np.concatenate([tail, self.order[:head_size]])
+
+    def _reshuffle(self, tail, head_size):
+        """Draws the permutation of the next cycle, its first `head_size` samples are not in `tail` (no duplicates in the subset)."""
+        in_tail = np.zeros(self.num_samples, dtype=bool)
+        in_tail[tail] = True
+        candidates = self.rng.permutation(np.flatnonzero(~in_tail))
+        head, rest = candidates[:head_size], candidates[head_size:]
+        self.order = np.concatenate([head, self.rng.permutation(np.concatenate([rest, tail]))])
+
+    def get_state(self):
+        """Returns the sampler state (JSON serializable)."""
+        return {
+            "num_samples": self.num_samples,
+            "subset_size": self.subset_size,
+            "order": self.order.tolist(),
+            "cursor": self.cursor,
+            "rng": self.rng.bit_generator.state,
+        }
+
+    def set_state(self, state):
+        """Restores a state from `get_state`.
+
+        Raises:
+            ValueError: If the state is for a different dataset size.
+        """
+        if state["num_samples"] != self.num_samples:
+            raise ValueError(f"The sampler state is for {state['num_samples']} samples, not {self.num_samples}.")
+        self.subset_size = state["subset_size"]
+        self.order = np.asarray(state["order"], dtype=np.int64)
+        self.cursor = state["cursor"]
+        self.rng.bit_generator.state = state["rng"]
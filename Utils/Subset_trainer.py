@@ -0,0 +1,119 @@
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.callbacks import CallbackList, History
+
+
+class SubsetTrainer:
+    """Trains the model subset by subset with one persistent compiled train step.
+
+    A new `model.fit` call per subset rebuilds the data adapter (and can
+    rebuild the train function). This trainer keeps one `tf.function` train
+    step and one predict step (made once, with a fixed input signature:
+    float32 images with any batch size) and reuses them for every subset,
+    running the callbacks itself with a `CallbackList`. `trace_counts`
+    counts how many times each step was traced and `retraces` how many of
+    these traces happened after the first call (0 if nothing retraced, the
+    first call can trace twice because it creates the optimizer variables).
+
+    Args:
+        model (keras.Model): The compiled model.
+        batch_size (int): The batch size.
+        steps_per_epoch (int): The number of train steps per epoch (the
+            remaining samples of an array subset are dropped).
+        jit_compile (bool): XLA compile the steps.
+    """
+
+    def __init__(self, model, batch_size, steps_per_epoch, jit_compile=False):
+        self.model = model
+        self.batch_size = batch_size
+        self.steps_per_epoch = steps_per_epoch
+        self.trace_counts = {"train": 0, "predict": 0}
+        self._first_call_counts = {}
+        x_spec = tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32)
+        y_spec = tf.TensorSpec((None,) + tuple(model.output_shape[1:]), tf.float32)
+        self._train_step = tf.function(self._train_step_fn, input_signature=[x_spec, y_spec], jit_compile=jit_compile)
+        self._predict_step = tf.function(self._predict_step_fn, input_signature=[x_spec], jit_compile=jit_compile)
+
+    def _train_step_fn(self, x, y):
+        # Python side effects only run while tracing
+        self.trace_counts["train"] += 1
+        # The step counter of the TensorBoard callback (the keras train_function also increments it)
+        self.model._train_counter.assign_add(1)
+        return self.model.train_step((x, y))
+
+    def _predict_step_fn(self, x):
+        self.trace_counts["predict"] += 1
+        return self.model(x, training=False)
+
+    def _call(self, name, step_fn, *args):
+        result = step_fn(*args)
+        self._first_call_counts.setdefault(name, self.trace_counts[name])
+        return result
+
+    @property
+    def retraces(self):
+        """The number of retraces (traces after the first call) of each step."""
+        return {name: count - self._first_call_counts.get(name, count) for name, count in self.trace_counts.items()}
+
+    def _batches(self, x, y, shuffle):
+        if isinstance(x, tf.data.Dataset):
+            yield from x.take(self.steps_per_epoch)
+            return
+        order = np.random.permutation(len(x)) if shuffle else np.arange(len(x))
+        for step in range(min(self.steps_per_epoch, len(x) // self.batch_size)):
+            index = np.sort(order[step * self.batch_size : (step + 1) * self.batch_size])
+            yield x[index], y[index]
+
+    def fit(self, x, y=None, epochs=1, initial_epoch=0, callbacks=None, shuffle=True, verbose=1):
+        """Trains on one subset (like `model.fit` for the epochs [initial_epoch, epochs)).
+
+        Args:
+            x: The images (np.ndarray) or a `tf.data.Dataset` of (x, y) batches.
+            y (np.ndarray): The labels (None for a dataset).
+            epochs (int): The epoch to stop at.
+            initial_epoch (int): The epoch to start at.
+            callbacks (list): The keras callbacks.
+            shuffle (bool): Shuffle the array data each epoch.
+            verbose (int): 0 or 1 (progress bar, syncs with the host every batch).
+
+        Returns:
+            The `History` callback (`.history` like `model.fit`).
+        """
+        history = History()
+        callbacks = CallbackList(
+            list(callbacks or []) + [history],
+            add_progbar=verbose != 0,
+            model=self.model,
+            verbose=verbose,
+            epochs=epochs,
+            steps=self.steps_per_epoch,
+        )
+        self.model.stop_training = False
+        callbacks.on_train_begin()
+        logs = {}
+        for epoch in range(initial_epoch, epochs):
+            self.model.reset_metrics()
+            callbacks.on_epoch_begin(epoch)
+            for step, (x_batch, y_batch) in enumerate(self._batches(x, y, shuffle)):
+                callbacks.on_train_batch_begin(step)
+                logs = self._call("train", self._train_step, tf.cast(x_batch, tf.float32), tf.cast(y_batch, tf.float32))
+                callbacks.on_train_batch_end(step, logs)
+                if self.model.stop_training:
+                    break
+            # The batch logs stay tensors, so with verbose=0 this is the one host sync per epoch
+            # (the progress bar of verbose=1 converts the logs of every batch, like in `model.fit`)
+            logs = {name: float(value) for name, value in logs.items()}
+            callbacks.on_epoch_end(epoch, logs)
+            if self.model.stop_training:
+                break
+        callbacks.on_train_end(logs)
+        return history
+
+    def predict(self, x, batch_size=None):
+        """Predicts images (np.ndarray) or a `tf.data.Dataset` of image batches with the persistent predict step."""
+        if isinstance(x, tf.data.Dataset):
+            batches = x
+        else:
+            batch_size = batch_size or self.batch_size
+            batches = (x[start : start + batch_size] for start in range(0, len(x), batch_size))
+        return np.concatenate([self._call("predict", self._predict_step, tf.cast(batch, tf.float32)).numpy() for batch in batches])
@@ -0,0 +1,179 @@
+import math
+
+import numpy as np
+import tensorflow as tf
+
+from Utils.Img_proc import block_noise_batch, clahe_batch
+
+# ImageDataGenerator fill_mode -> ImageProjectiveTransformV3 fill_mode
+_FILL_MODES = {"nearest": "NEAREST", "reflect": "REFLECT", "wrap": "WRAP", "constant": "CONSTANT"}
+
+
+def _uniform_range(batch, low, high):
+    return tf.random.uniform((batch,), low, high, dtype=tf.float32)
+
+
+def _transform_matrices(batch, height, width, datagen):
+    """Makes the random (batch, 8) projective transforms of an `ImageDataGenerator`.
+
+    Same matrices as `ImageDataGenerator.get_random_transform` /
+    `apply_affine_transform` (rotation, shift, shear and zoom around the
+    image center, in (row, col) order), swapped to the (x = col, y = row)
+    order of `ImageProjectiveTransformV3`. The matrices map the output pixels
+    to the input pixels.
+    """
+    zeros, ones = tf.zeros((batch,)), tf.ones((batch,))
+    theta = _uniform_range(batch, -datagen.rotation_range, datagen.rotation_range) * (math.pi / 180)
+    shear = _uniform_range(batch, -datagen.shear_range, datagen.shear_range) * (math.pi / 180)
+    zx = _uniform_range(batch, datagen.zoom_range[0], datagen.zoom_range[1])
+    zy = _uniform_range(batch, datagen.zoom_range[0], datagen.zoom_range[1])
+    # The shift ranges are fractions of the size (keras also allows pixels if >= 1)
+    tx = _uniform_range(batch, -datagen.height_shift_range, datagen.height_shift_range)
+    ty = _uniform_range(batch, -datagen.width_shift_range, datagen.width_shift_range)
+    tx = tx * height if datagen.height_shift_range < 1 else tx
+    ty = ty * width if datagen.width_shift_range < 1 else ty
+
+    def matrix(rows):
+        return tf.stack([tf.stack(row, axis=-1) for row in rows], axis=-2)
+
+    cos, sin = tf.cos(theta), tf.sin(theta)
+    rotation = matrix([[cos, -sin, zeros], [sin, cos, zeros], [zeros, zeros, ones]])
+    shift = matrix([[ones, zeros, tx], [zeros, ones, ty], [zeros, zeros, ones]])
+    shear = matrix([[ones, -tf.sin(shear), zeros], [zeros, tf.cos(shear), zeros], [zeros, zeros, ones]])
+    zoom = matrix([[zx, zeros, zeros], [zeros, zy, zeros], [zeros, zeros, ones]])
+    o_x, o_y = height / 2 - 0.5, width / 2 - 0.5
+    offset = tf.constant([[1, 0, o_x], [0, 1, o_y], [0, 0, 1]], dtype=tf.float32)
+    reset = tf.constant([[1, 0, -o_x], [0, 1, -o_y], [0, 0, 1]], dtype=tf.float32)
+    # (row, col) -> (col, row)
+    swap = tf.constant([[0, 1, 0], [1, 0, 0], [0, 0, 1]], dtype=tf.float32)
+    transform = swap @ offset @ rotation @ shift @ shear @ zoom @ reset @ swap
+    return tf.reshape(transform, (batch, 9))[:, :8]
+
+
+def _random_flip(images, axis):
+    flip = tf.random.uniform((tf.shape(images)[0], 1, 1, 1)) < 0.5
+    return tf.where(flip, tf.reverse(images, axis=[axis]), images)
+
+
+def _min_max(images, max_val):
+    """Scales the whole batch to the 0 - max_val range (like `normalize_TO_RANGE`)."""
+    low, high = tf.reduce_min(images), tf.reduce_max(images)
+    return (images - low) / tf.maximum(high - low, 1e-7) * max_val
+
+
+def _augment_batch(images, datagen, noise_profile, grain, clahe_clip_limit, clahe_luminance, in_scale):
+    batch, height, width = tf.shape(images)[0], images.shape[1], images.shape[2]
+    images = tf.cast(images, tf.float32) * in_scale
+    # Geometric transforms (random_transform)
+    images = tf.raw_ops.ImageProjectiveTransformV3(
+        images=images,
+        transforms=_transform_matrices(batch, height, width, datagen),
+        output_shape=tf.constant([height, width]),
+        fill_value=tf.constant(datagen.cval, tf.float32),
+        interpolation="NEAREST" if datagen.interpolation_order == 0 else "BILINEAR",
+        fill_mode=_FILL_MODES[datagen.fill_mode],
+    )
+    if datagen.horizontal_flip:
+        images = _random_flip(images, 2)
+    if datagen.vertical_flip:
+        images = _random_flip(images, 1)
+    if datagen.channel_shift_range:
+        # Per image shift clipped to the image range (apply_channel_shift)
+        low = tf.reduce_min(images, axis=(1, 2, 3), keepdims=True)
+        high = tf.reduce_max(images, axis=(1, 2, 3), keepdims=True)
+        shift = tf.random.uniform((batch, 1, 1, 1), -datagen.channel_shift_range, datagen.channel_shift_range)
+        images = tf.clip_by_value(images + shift, low, high)
+    if datagen.brightness_range is not None:
+        # apply_brightness_shift stretches the image to 0-255 before the (clipped) PIL brightness
+        low = tf.reduce_min(images, axis=(1, 2, 3), keepdims=True)
+        high = tf.reduce_max(images, axis=(1, 2, 3), keepdims=True)
+        images = (images - low) / tf.maximum(high - low, 1e-7) * 255
+        brightness = tf.random.uniform((batch, 1, 1, 1), datagen.brightness_range[0], datagen.brightness_range[1])
+        images = tf.clip_by_value(images * brightness, 0, 255)
+    # Noise (preprocessing_function)
+    if noise_profile is not None:
+        images = tf.numpy_function(lambda x: block_noise_batch(x, noise_profile, grain=grain), [images], tf.float32, stateful=True)
+    # Feature-wise standardization (standardize)
+    if datagen.featurewise_center and datagen.mean is not None:
+        images -= tf.constant(datagen.mean, tf.float32)
+    if datagen.featurewise_std_normalization and datagen.std is not None:
+        images /= tf.constant(datagen.std, tf.float32) + 1e-6
+    # Normalization + CLAHE (the z-score before the last min-max has no effect)
+    images = _min_max(images, 255)
+    if clahe_clip_limit:
+        images = tf.numpy_function(
+            lambda x: clahe_batch(x, clahe_clip_limit, luminance=clahe_luminance), [images], tf.uint8, stateful=False
+        )
+        images = tf.cast(images, tf.float32)
+    images = _min_max(images, 1)
+    return tf.ensure_shape(images, (None, height, width, images.shape[3]))
+
+
+def augment_dataset(
+    x,
+    y,
+    datagen,
+    batch_size=16,
+    noise_profile="TRLRev2",
+    grain=True,
+    clahe_clip_limit=0.5,
+    clahe_luminance=False,
+    in_scale=1,
+    shuffle=True,
+    seed=None,
+):
+    """Makes a tf.data pipeline that augments the images on the fly, per batch.
+
+    Reproduces the Rev2 subset chain (`ImageDataGenerator.flow` random
+    transforms -> block noise -> feature-wise standardization -> 0-255
+    normalization -> CLAHE -> 0-1 normalization) with the augmentation
+    settings (and fitted mean/std) of `datagen`. The batches are augmented in
+    parallel (`num_parallel_calls=AUTOTUNE`) and prefetched, so the CPU
+    augments while the model trains. Each epoch gets new random augmentations.
+
+    Note: The min-max normalizations are per batch instead of per subset.
+
+    Args:
+        x (np.ndarray): The (N, H, W, C) images.
+        y (np.ndarray): The labels.
+        datagen (ImageDataGenerator): The generator whose augmentation
+            settings are used (its `preprocessing_function` is ignored).
+        batch_size (int): The batch size.
+        noise_profile (str): The block noise profile (see
+            `Utils.Img_proc.NOISE_PROFILES`) or None for no noise.
+        grain (bool): Add grain noise.
+        clahe_clip_limit (float): The CLAHE clip limit (0 or None to skip CLAHE).
+        clahe_luminance (bool): Run CLAHE on the luminance only (see `clahe_batch`).
+        in_scale (float): Multiplied with the images first (255 for 0-1 data).
+        shuffle (bool): Shuffle the images each epoch.
+        seed (int): Optional shuffle seed.
+
+    Returns:
+        A `tf.data.Dataset` yielding float32 (x, y) batches in the 0-1 range.
+    """
+    # The images are kept once on the CPU and gathered per batch
+    with tf.device("/CPU:0"):
+        x_tensor, y_tensor = tf.constant(x), tf.constant(y)
+    dataset = tf.data.Dataset.range(len(x))
+    if shuffle:
+        dataset = dataset.shuffle(len(x), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+    dataset = dataset.map(
+        lambda index: (
+            _augment_batch(tf.gather(x_tensor, index), datagen, noise_profile, grain, clahe_clip_limit, clahe_luminance, in_scale),
+            tf.gather(y_tensor, index),
+        ),
+        num_parallel_calls=tf.data.AUTOTUNE,
+    )
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def take_samples(dataset, num_samples):
+    """Returns the first `num_samples` (x, y) samples of a batched dataset as numpy arrays."""
+    x, y = [], []
+    for x_batch, y_batch in dataset.as_numpy_iterator():
+        x.append(x_batch)
+        y.append(y_batch)
+        if sum(len(batch) for batch in x) >= num_samples:
+            break
+    return np.concatenate(x)[:num_samples], np.concatenate(y)[:num_samples]
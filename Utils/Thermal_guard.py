@@ -0,0 +1,133 @@
+import math
+import subprocess
+import threading
+import time
+
+from tensorflow.keras.callbacks import Callback
+
+from Utils.print_color_V1_OLD import print_Color
+
+# The errors of a failed temperature read (e.g. the GPU driver or nvidia-smi not responding)
+READ_ERRORS = (OSError, RuntimeError, ValueError, subprocess.SubprocessError)
+
+
+class TemperatureSensor:
+    """Samples a temperature on a background thread.
+
+    `read_fn` (e.g. `gpu_control.get_temperature`) is called every
+    `interval` seconds and the last value is kept in `temperature`, so the
+    readers never wait for the sensor. Any `read_fn` works (e.g. a fake
+    reader for testing on machines without a GPU).
+
+    A failed read (one of `read_errors`) is kept in `error` until the next
+    successful read. Any other error stops the sampling thread and is kept
+    in `error` as a `RuntimeError`.
+
+    Args:
+        read_fn (callable): Returns the current temperature.
+        interval (float): The sampling interval in seconds.
+        read_errors (tuple): The errors of a failed read (retried on the next sample).
+    """
+
+    def __init__(self, read_fn, interval=2.0, read_errors=READ_ERRORS):
+        self.read_fn = read_fn
+        self.interval = interval
+        self.read_errors = read_errors
+        self.temperature = math.nan
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                try:
+                    self.temperature = float(self.read_fn())
+                    self.error = None
+                except self.read_errors as err:
+                    self.error = err
+                self._stop.wait(self.interval)
+        finally:
+            if not self._stop.is_set():
+                # An unexpected error stopped the sampling, so the last temperature is stale
+                self.error = RuntimeError("The temperature sensor thread stopped (see its traceback).")
+
+    def start(self):
+        """Starts sampling (does nothing if already started)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="TemperatureSensor", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops sampling."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class ThermalGuard(Callback):
+    """Throttles the training by the temperature of a `TemperatureSensor`.
+
+    Replaces the blocking `TerminateOnHighTemp` checks: each batch only reads
+    the last sampled value. The throttling is graded:
+    - Over `throttle_temp` a short sleep is added after each batch, growing
+      linearly up to `max_batch_sleep` at `high_temp`.
+    - Over `high_temp` the training pauses (at least `pause_time` seconds)
+      until the temperature is back under `low_temp`, the sensor fails (its
+      last value is stale then) or `max_pause_time` has passed.
+    While the sensor is failing the training is not throttled.
+
+    Args:
+        sensor (TemperatureSensor): The (started) sensor.
+        throttle_temp (float): The temperature where the per batch sleeps start.
+        high_temp (float): The temperature that pauses the training.
+        low_temp (float): The temperature to resume at after a pause.
+        max_batch_sleep (float): The per batch sleep at `high_temp` in seconds.
+        pause_time (float): The min pause in seconds.
+        max_pause_time (float): The max pause in seconds (None for no limit).
+    """
+
+    def __init__(self, sensor, throttle_temp=68, high_temp=75, low_temp=60, max_batch_sleep=0.5, pause_time=60, max_pause_time=900):
+        super().__init__()
+        self.sensor = sensor
+        self.throttle_temp = throttle_temp
+        self.high_temp = high_temp
+        self.low_temp = low_temp
+        self.max_batch_sleep = max_batch_sleep
+        self.pause_time = pause_time
+        self.max_pause_time = max_pause_time
+        self.throttle_time = 0.0
+        self.pause_count = 0
+
+    def on_train_batch_end(self, batch, logs=None):
+        temperature = self.sensor.temperature
+        if self.sensor.error is not None or math.isnan(temperature) or temperature <= self.throttle_temp:
+            return
+        if temperature > self.high_temp:
+            self._pause(temperature)
+            return
+        sleep_time = self.max_batch_sleep * (temperature - self.throttle_temp) / max(self.high_temp - self.throttle_temp, 1e-7)
+        time.sleep(sleep_time)
+        self.throttle_time += sleep_time
+
+    def _pause(self, temperature):
+        print_Color(
+            f"\nPausing training due to high GPU temperature! ([{temperature:.0f}] for at least [{self.pause_time}]sec)",
+            ["red"],
+            advanced_mode=False,
+        )
+        start_time = time.time()
+        time.sleep(self.pause_time if self.max_pause_time is None else min(self.pause_time, self.max_pause_time))
+        while self.sensor.temperature > self.low_temp and self.sensor.error is None:
+            if self.max_pause_time is not None and time.time() - start_time >= self.max_pause_time:
+                print_Color(f"Max pause time reached! (temperature still [{self.sensor.temperature:.0f}])", ["red"], advanced_mode=False)
+                break
+            time.sleep(min(self.sensor.interval, 4))
+        if self.sensor.error is not None:
+            print_Color(f"Temperature sensor failed! ({self.sensor.error})", ["red"], advanced_mode=False)
+        self.throttle_time += time.time() - start_time
+        self.pause_count += 1
+        print_Color("Resuming training...", ["yellow"])
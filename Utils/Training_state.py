@@ -0,0 +1,77 @@
+import json
+import os
+import random
+
+import numpy as np
+import tensorflow as tf
+
+
+def _to_json(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class TrainingStateSnapshot:
+    """Resumable snapshots of the training state.
+
+    A snapshot is a `tf.train.Checkpoint` of the model and its optimizer
+    (the weights, the optimizer slots and iterations, so a resumed training
+    does not have to re-warm) plus a `state.json` with the loop state (any
+    JSON serializable dict, numpy values are converted) and the global
+    numpy/python RNG states. The JSON is written last (to a temp file that
+    replaces the old one) and names its checkpoint, so a crash while saving
+    leaves the previous snapshot usable.
+
+    Args:
+        model (keras.Model): The compiled model.
+        directory (str): The snapshot directory.
+        max_to_keep (int): The number of checkpoints to keep (>=2 so the previous snapshot survives a failed save).
+    """
+
+    def __init__(self, model, directory, max_to_keep=2):
+        self.directory = directory
+        self.state_path = os.path.join(directory, "state.json")
+        self._checkpoint = tf.train.Checkpoint(model=model, optimizer=model.optimizer)
+        self._manager = tf.train.CheckpointManager(self._checkpoint, directory, max_to_keep=max(2, max_to_keep))
+
+    def exists(self):
+        """Returns True if there is a snapshot to resume from."""
+        return os.path.exists(self.state_path)
+
+    def save(self, state):
+        """Saves a snapshot.
+
+        Args:
+            state (dict): The loop state (its "epoch" numbers the checkpoint if given).
+        """
+        checkpoint_path = self._manager.save(checkpoint_number=state.get("epoch"))
+        snapshot = {
+            "checkpoint": os.path.basename(checkpoint_path),
+            "state": state,
+            "rng": {"numpy": list(np.random.get_state()), "python": random.getstate()},
+        }
+        temp_path = f"{self.state_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(snapshot, f, default=_to_json)
+        os.replace(temp_path, self.state_path)
+
+    def restore(self):
+        """Restores the model, the optimizer and the RNG states of the last snapshot.
+
+        Returns:
+            The loop state dict of the snapshot (None if there is no snapshot).
+        """
+        if not self.exists():
+            return None
+        with open(self.state_path) as f:
+            snapshot = json.load(f)
+        # The optimizer slots are restored when they are created (on the first train step)
+        self._checkpoint.restore(os.path.join(self.directory, snapshot["checkpoint"])).expect_partial()
+        name, key, pos, has_gauss, cached_gaussian = snapshot["rng"]["numpy"]
+        np.random.set_state((name, np.asarray(key, dtype=np.uint32), pos, has_gauss, cached_gaussian))
+        version, internal_state, gauss_next = snapshot["rng"]["python"]
+        random.setstate((version, tuple(internal_state), gauss_next))
+        return snapshot["state"]
@@ -0,0 +1,74 @@
+import numpy as np
+import tensorflow as tf
+
+
+def to_uint8(arr, chunk_size=1024):
+    """Converts 0-255 image data to uint8 (rounded and clipped).
+
+    Works chunk by chunk, so the float temporaries are at most
+    `chunk_size` images big instead of a full copy of `arr`.
+
+    Args:
+        arr: The image data (any array-like supporting slicing).
+        chunk_size (int): The number of images converted at once.
+
+    Returns:
+        The uint8 array.
+    """
+    if getattr(arr, "dtype", None) == np.uint8:
+        return np.asarray(arr)
+    out = np.empty(arr.shape, dtype=np.uint8)
+    for i in range(0, arr.shape[0], chunk_size):
+        out[i : i + chunk_size] = np.clip(np.rint(arr[i : i + chunk_size]), 0, 255)
+    return out
+
+
+def to_float(arr, scale=1 / 255, dtype=np.float32):
+    """Converts uint8 image data to scaled float (float data is returned unchanged).
+
+    Args:
+        arr (np.ndarray): The image data.
+        scale (float): The scale applied after the cast (1 / 255 for 0-1 data).
+        dtype: The float dtype.
+
+    Returns:
+        The float array.
+    """
+    if arr.dtype != np.uint8:
+        return arr
+    out = arr.astype(dtype)
+    out *= scale
+    return out
+
+
+def uint8_to_float(x, scale=1 / 255, dtype=tf.float32):
+    """Casts a uint8 image tensor to float and scales it (for tf.data maps)."""
+    return tf.cast(x, dtype) * tf.constant(scale, dtype)
+
+
+def uint8_dataset(x, y=None, batch_size=32, scale=1 / 255, shuffle=False, seed=None):
+    """Makes a batched tf.data pipeline over uint8 image data.
+
+    The images stay uint8 in RAM and are only cast to float32 and
+    scaled per batch, right before they are fed to the model.
+
+    Args:
+        x (np.ndarray): The uint8 images.
+        y (np.ndarray): The labels (optional).
+        batch_size (int): The batch size.
+        scale (float): The scale applied after the cast (1 / 255 for 0-1 data).
+        shuffle (bool): Shuffle the data each iteration.
+        seed (int): Optional shuffle seed.
+
+    Returns:
+        A `tf.data.Dataset` yielding (x, y) or x batches.
+    """
+    dataset = tf.data.Dataset.from_tensor_slices(x if y is None else (x, y))
+    if shuffle:
+        dataset = dataset.shuffle(len(x), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+    if y is None:
+        dataset = dataset.map(lambda x_b: uint8_to_float(x_b, scale), num_parallel_calls=tf.data.AUTOTUNE)
+    else:
+        dataset = dataset.map(lambda x_b, y_b: (uint8_to_float(x_b, scale), y_b), num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
@@ -0,0 +1,110 @@
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.callbacks import Callback
+
+from Utils.print_color_V1_OLD import print_Color
+from Utils.Uint8_data import uint8_dataset
+
+
+def stratified_indices(y, sample_size, seed=None):
+    """Picks a random sample with the same class ratios as `y`.
+
+    Args:
+        y (np.ndarray): The one-hot (or int) labels.
+        sample_size (int): The sample size.
+        seed (int): Optional random seed.
+
+    Returns:
+        The sorted int64 indices.
+    """
+    labels = np.argmax(y, axis=-1) if np.ndim(y) > 1 else np.asarray(y)
+    rng = np.random.default_rng(seed)
+    indices = []
+    for label in np.unique(labels):
+        class_indices = np.flatnonzero(labels == label)
+        count = max(1, round(sample_size * len(class_indices) / len(labels)))
+        indices.append(rng.choice(class_indices, min(count, len(class_indices)), replace=False))
+    return np.sort(np.concatenate(indices))
+
+
+class ValidationScheduler(Callback):
+    """Validation with one prediction pass per epoch, shared by all its users.
+
+    Replaces `validation_data` in `model.fit` (put it first in the callbacks
+    so `val_loss`/`val_accuracy` are in the logs of the callbacks after it).
+    Each epoch predicts a fixed stratified sample of the validation set, and
+    the full set every `full_every` epochs (or every epoch if `sample_size`
+    is None). The last predictions are cached, so the best-model tracking
+    (`evaluate`) and the confusion matrix (`y_true`/`y_pred`) do not predict
+    again until the weights change (`invalidate`). The loss includes the
+    model regularization losses, like the `model.evaluate` loss.
+
+    Args:
+        x (np.ndarray): The validation images (uint8 data is scaled per batch).
+        y (np.ndarray): The one-hot labels.
+        batch_size (int): The prediction batch size.
+        sample_size (int): The stratified sample size (None for always the full set).
+        full_every (int): Predict the full set every n epochs.
+        uint8_scale (float): The scale of uint8 images (see `uint8_dataset`).
+        seed (int): Optional sample seed.
+        verbose (bool): Print the validation results.
+        predict_fn (callable): Optional `predict_fn(x)` used instead of `model.predict`
+            (e.g. `SubsetTrainer.predict`).
+    """
+
+    def __init__(self, x, y, batch_size=32, sample_size=None, full_every=1, uint8_scale=1 / 255, seed=None, verbose=True, predict_fn=None):
+        super().__init__()
+        self.predict_fn = predict_fn
+        self.x, self.y = x, np.asarray(y)
+        self.batch_size = batch_size
+        self.full_every = max(1, full_every)
+        self.uint8_scale = uint8_scale
+        self.verbose = verbose
+        self.sample_indices = None
+        if sample_size is not None and sample_size < len(self.y):
+            self.sample_indices = stratified_indices(self.y, sample_size, seed=seed)
+        self.invalidate()
+
+    def invalidate(self):
+        """Drops the cached predictions (call after the model weights were changed outside of training)."""
+        self.y_true, self.y_pred, self.full, self.results = None, None, False, {}
+
+    def _predict(self, full):
+        x = self.x if full or self.sample_indices is None else self.x[self.sample_indices]
+        if getattr(x, "dtype", None) == np.uint8:
+            x = uint8_dataset(x, batch_size=self.batch_size, scale=self.uint8_scale)
+        if self.predict_fn is not None:
+            y_pred = self.predict_fn(x)
+        else:
+            y_pred = self.model.predict(x, batch_size=None if isinstance(x, tf.data.Dataset) else self.batch_size, verbose=0)
+        self.full = full or self.sample_indices is None
+        self.y_true = self.y if self.full else self.y[self.sample_indices]
+        self.y_pred = y_pred
+        loss = tf.reduce_mean(tf.keras.losses.get(self.model.loss)(tf.constant(self.y_true, tf.float32), tf.constant(y_pred, tf.float32)))
+        # Plus the regularization losses (e.g. the l2 kernel_regularizer), like `model.evaluate`
+        if self.model.losses:
+            loss += tf.add_n([tf.cast(reg_loss, tf.float32) for reg_loss in self.model.losses])
+        self.results = {
+            "loss": float(loss),
+            "accuracy": float(np.mean(np.argmax(y_pred, axis=-1) == np.argmax(self.y_true, axis=-1))),
+        }
+        return self.results
+
+    def evaluate(self, full=True):
+        """Returns the validation {"loss", "accuracy"} (the cached results if they cover the requested set)."""
+        if self.results and (self.full or not full):
+            return self.results
+        return self._predict(full)
+
+    def on_epoch_end(self, epoch, logs=None):
+        full = (epoch + 1) % self.full_every == 0
+        results = self._predict(full)
+        if logs is not None:
+            logs.update({f"val_{key}": value for key, value in results.items()})
+        if self.verbose:
+            val_set = "full" if self.full else f"sample:{len(self.y_true)}"
+            print_Color(
+                f"~*- Validation [{val_set}] ~*loss: {results['loss']:.4f} - accuracy: {results['accuracy']:.4f}",
+                ["yellow", "green"],
+                advanced_mode=True,
+            )
@@ -1,4 +1,6 @@
 from tensorflow import keras
+import tensorflow as tf
+import numpy as np
 import math
 import matplotlib.pyplot as plt
 
@@ -211,3 +213,143 @@ class OneCycleLr(keras.callbacks.Callback):
         ax1.set_title("Learning Rate vs Steps")
         ax2.plot(self.track_mom)
         ax2.set_title("Momentum (or beta_1) vs Steps")
+
+
+def one_cycle_values(
+    total_steps: int,
+    max_lr: float,
+    pct_start: float = 0.3,
+    anneal_strategy: str = "cos",
+    base_momentum: float = 0.85,
+    max_momentum: float = 0.95,
+    div_factor: float = 25.0,
+    final_div_factor: float = 1e4,
+):
+    """
+    Precomputes the learning rate and momentum of every step of a cycle
+    (the same values that `OneCycleLr` sets, step `i` is the i-th batch).
+
+    Args: see `OneCycleLr`.
+
+    Returns:
+    A tuple (lrs, moms) of float32 arrays with `total_steps` values.
+    """
+    if anneal_strategy not in ["cos", "linear"]:
+        raise ValueError(f"anneal_strategy must by one of 'cos' or 'linear', instead got {anneal_strategy}")
+
+    def anneal(start, end, pct):
+        if anneal_strategy == "cos":
+            return end + (start - end) / 2.0 * (np.cos(np.pi * pct) + 1)
+        return (end - start) * pct + start
+
+    initial_lr = max_lr / div_factor
+    min_lr = initial_lr / final_div_factor
+    step_size_up = float(pct_start * total_steps) - 1
+    step_size_down = float(total_steps - step_size_up) - 1
+    # OneCycleLr sets the value of step_num after batch step_num (batch 0 uses the initial values)
+    step_num = np.maximum(np.arange(total_steps, dtype=np.float64) - 1, 0)
+    up = step_num <= step_size_up
+    pct_up = step_num / max(step_size_up, 1e-12)
+    pct_down = (step_num - step_size_up) / max(step_size_down, 1e-12)
+    lrs = np.where(up, anneal(initial_lr, max_lr, pct_up), anneal(max_lr, min_lr, pct_down))
+    moms = np.where(up, anneal(max_momentum, base_momentum, pct_up), anneal(base_momentum, max_momentum, pct_down))
+    return lrs.astype(np.float32), moms.astype(np.float32)
+
+
+class OneCycleSchedule(keras.optimizers.schedules.LearningRateSchedule):
+    """
+    The 1cycle policy of `OneCycleLr` as an in-graph learning rate schedule
+    (plus a momentum schedule), so there is no per batch python callback or
+    host-device sync. The cycle is precomputed (`one_cycle_values`) into
+    variables and looked up with the optimizer step. `restart` starts a new
+    cycle (e.g. per subset) by assigning new values once.
+
+    The values are not tracked per batch; `values` / `plot_lrs_moms` return
+    or plot the current cycle on demand.
+
+    Args:
+    max_lr (float): Upper learning rate boundaries in the cycle.
+    total_steps (int): The total number of steps in the cycle.
+    start_step (int): The optimizer step (`optimizer.iterations`) the cycle starts at.
+    **one_cycle_kwargs: pct_start, anneal_strategy, base_momentum, max_momentum,
+            div_factor and final_div_factor (see `OneCycleLr`).
+    """
+
+    def __init__(self, max_lr: float, total_steps: int, start_step: int = 0, **one_cycle_kwargs) -> None:
+        super().__init__()
+        self.max_lr = max_lr
+        self.total_steps = total_steps
+        self.one_cycle_kwargs = one_cycle_kwargs
+        lrs, moms = one_cycle_values(total_steps, max_lr, **one_cycle_kwargs)
+        self._lrs = tf.Variable(lrs, shape=tf.TensorShape([None]), trainable=False, name="one_cycle_lrs")
+        self._moms = tf.Variable(moms, shape=tf.TensorShape([None]), trainable=False, name="one_cycle_moms")
+        self._start_step = tf.Variable(start_step, dtype=tf.int64, trainable=False, name="one_cycle_start_step")
+
+    def restart(self, start_step: int, max_lr: float | None = None, total_steps: int | None = None) -> None:
+        """Starts a new cycle at `start_step` (with a new max_lr / total_steps if given)."""
+        self.max_lr = max_lr if max_lr is not None else self.max_lr
+        self.total_steps = total_steps if total_steps is not None else self.total_steps
+        lrs, moms = one_cycle_values(self.total_steps, self.max_lr, **self.one_cycle_kwargs)
+        self._lrs.assign(lrs)
+        self._moms.assign(moms)
+        self._start_step.assign(start_step)
+
+    def _index(self, step):
+        # The last value is kept after the end of the cycle
+        index = tf.cast(step, tf.int64) - self._start_step
+        return tf.clip_by_value(index, 0, tf.cast(tf.size(self._lrs), tf.int64) - 1)
+
+    def __call__(self, step):
+        return tf.gather(self._lrs, self._index(step))
+
+    def momentum(self, step):
+        """Returns the momentum (or beta_1) of a step."""
+        return tf.gather(self._moms, self._index(step))
+
+    def apply(self, optimizer, momentum_name: str = "momentum") -> None:
+        """Sets the learning rate and the momentum (or beta_1) of a (keras 2.10 `OptimizerV2`) optimizer to the schedules.
+
+        A `LossScaleOptimizer` (mixed precision) is unwrapped, the schedules are set on its inner optimizer.
+        This also works on an optimizer that already trained: its momentum is a variable then, which the
+        hyperparameter setter would assign a callable to, but a schedule replaces it (so the momentum is set
+        to this schedule first and then to the callable).
+
+        Args:
+        optimizer: The optimizer.
+        momentum_name (str): The momentum hyperparameter ("momentum" for SGD/RMSprop, "beta_1" for Adam and co).
+        """
+        optimizer = getattr(optimizer, "inner_optimizer", optimizer)
+        optimizer.learning_rate = self
+        setattr(optimizer, momentum_name, self)
+        setattr(optimizer, momentum_name, lambda: self.momentum(optimizer.iterations))
+
+    def get_state(self):
+        """Returns the state of the current cycle (JSON serializable, for `set_state`)."""
+        return {"start_step": int(self._start_step.numpy()), "max_lr": self.max_lr, "total_steps": self.total_steps}
+
+    def set_state(self, state) -> None:
+        """Restores a cycle from `get_state`."""
+        self.restart(state["start_step"], max_lr=state["max_lr"], total_steps=state["total_steps"])
+
+    def values(self):
+        """Returns the (lrs, moms) numpy arrays of the current cycle."""
+        return self._lrs.numpy(), self._moms.numpy()
+
+    def plot_lrs_moms(self, axes=None) -> None:
+        if axes is None:
+            _, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 5))
+        else:
+            ax1, ax2 = axes[0], axes[1]
+        lrs, moms = self.values()
+        ax1.plot(lrs)
+        ax1.set_title("Learning Rate vs Steps")
+        ax2.plot(moms)
+        ax2.set_title("Momentum (or beta_1) vs Steps")
+
+    def get_config(self):
+        return {
+            "max_lr": self.max_lr,
+            "total_steps": self.total_steps,
+            "start_step": int(self._start_step.numpy()),
+            **self.one_cycle_kwargs,
+        }